@@ -0,0 +1,83 @@
+"""
+Benchmark calculate_dependence_range against the groupby-apply it replaced.
+
+Synthetic partial dependence data is generated with an increasing number of models
+(species x activity types) and features, to show how each approach scales with the
+number of curves.
+
+Run from the repository root, with the app's environment variables set:
+
+    python benchmarks/dependence_range.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "dashboard"))
+
+from app_utils.data import calculate_dependence_range  # noqa: E402
+
+ACTIVITY_TYPES = ["All", "Roost", "In flight"]
+
+
+def synthetic_partial_dependence(n_species: int, n_features: int, n_points: int = 50, seed: int = 0) -> pd.DataFrame:
+    """
+    This function generates partial dependence curves shaped like the app data.
+
+    Args:
+        n_species: int - The number of species, each modelled for every activity type.
+        n_features: int - The number of features per model.
+        n_points: int - The number of points along each curve.
+
+    Returns: pd.DataFrame - The partial dependence data.
+    """
+    rng = np.random.default_rng(seed)
+    n_curves = n_species * len(ACTIVITY_TYPES) * n_features
+    latin_name = np.repeat([f"Species {i}" for i in range(n_species)], len(ACTIVITY_TYPES) * n_features * n_points)
+    activity_type = np.tile(np.repeat(ACTIVITY_TYPES, n_features * n_points), n_species)
+    feature = np.tile(np.repeat([f"feature_{i}" for i in range(n_features)], n_points), n_species * len(ACTIVITY_TYPES))
+    df = pd.DataFrame(
+        {
+            "latin_name": latin_name,
+            "activity_type": activity_type,
+            "feature": feature,
+            "values": np.tile(np.linspace(0, 1, n_points), n_curves),
+            "average": rng.normal(size=n_curves * n_points).cumsum(),
+        }
+    )
+    # Match the categorical columns load_partial_dependence_data returns
+    return df.astype({"latin_name": "category", "activity_type": "category", "feature": "category"})
+
+
+def groupby_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The original implementation, for comparison.
+    """
+    return (
+        df.groupby(["latin_name", "activity_type", "feature"], observed=True)["average"]
+        .apply(lambda x: x.max() - x.min())
+        .reset_index()
+    )
+
+
+def main():
+    print(f"{'curves':>8} {'rows':>10} {'apply ms':>10} {'vectorised ms':>14} {'speedup':>8}")
+    for n_species, n_features in [(5, 10), (17, 20), (50, 40), (200, 50)]:
+        df = synthetic_partial_dependence(n_species, n_features)
+        n_curves = n_species * len(ACTIVITY_TYPES) * n_features
+
+        expected = groupby_apply(df)
+        result = calculate_dependence_range(df)
+        assert np.allclose(result["average"], expected["average"])
+
+        repeats = 3
+        apply_ms = min(timeit.repeat(lambda: groupby_apply(df), number=1, repeat=repeats)) * 1000
+        vector_ms = min(timeit.repeat(lambda: calculate_dependence_range(df), number=1, repeat=repeats)) * 1000
+        print(f"{n_curves:>8} {len(df):>10} {apply_ms:>10.1f} {vector_ms:>14.1f} {apply_ms / vector_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Load test one app worker with many concurrent simulated sessions.
+
+Every session connects to the same app, in this process, and runs a random mix of the
+interactions users make: changing species and activity type, dragging the opacity
+slider, and switching to the partial dependence and models tabs. The sessions run in
+their own threads but share the app's single event loop, as they would on one worker.
+
+For each number of concurrent sessions the report gives:
+
+- p50/p95/p99 latency of the interactions, from sending the input to receiving the outputs
+- resident memory added per connected session
+- how long the event loop was stalled, measured by a heartbeat that should wake every 10ms
+
+The number of sessions at which p95 latency passes --max-p95 is the per-worker ceiling.
+
+Run from the repository root:
+
+    python benchmarks/load.py --sessions 1 5 10 20
+    python benchmarks/load.py --sessions 10 --scale medium --steps 30 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import synthetic
+from run import configure_environment, prepare_bucket
+from sessions import SimulatedSession, initial_inputs
+
+HEARTBEAT_SECONDS = 0.01
+
+
+def rss_bytes() -> int:
+    """
+    This function gets the resident memory of this process.
+
+    Falls back to the peak resident memory where /proc isn't available, e.g. macOS.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """
+    This function gets the p50, p95, p99 and max of a list of values.
+    """
+    if len(values) < 2:
+        value = values[0] if values else float("nan")
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(values)}
+
+
+class EventLoopMonitor:
+    """
+    Measure how late the event loop wakes a task that sleeps for a fixed interval.
+
+    Any lateness is time the loop spent running something else without yielding, so it
+    is felt as extra latency by every session on the worker.
+
+    Args:
+        portal: BlockingPortal - The portal of the event loop to watch, e.g. `TestClient.portal`.
+    """
+
+    def __init__(self, portal, interval: float = HEARTBEAT_SECONDS):
+        self.portal = portal
+        self.interval = interval
+        self.lags: list[float] = []
+        self._stop = threading.Event()
+        self._future = None
+
+    async def _heartbeat(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def __enter__(self) -> "EventLoopMonitor":
+        self._future = self.portal.start_task_soon(self._heartbeat)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._future.result()
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "stall_total": sum(self.lags),
+            "stall_max": max(self.lags, default=0.0),
+            "stall_p99": percentiles(self.lags)["p99"],
+        }
+
+
+def user_flow(session: SimulatedSession, rng: random.Random, steps: int, species: list[str], features: list[str], think_seconds: float):
+    """
+    This function plays a random sequence of the interactions users make.
+
+    Args:
+        session: SimulatedSession - The connected session.
+        rng: random.Random - The source of the choices, seeded per session.
+        steps: int - The number of actions to take.
+        species: list[str] - The latin names to choose from.
+        features: list[str] - The features to choose from.
+        think_seconds: float - The mean pause between actions.
+    """
+    tab = "map"
+    for _ in range(steps):
+        time.sleep(rng.expovariate(1 / think_seconds) if think_seconds else 0)
+        if tab == "map":
+            action = rng.choices(["species", "activity_type", "opacity", "tab"], weights=[4, 2, 3, 1])[0]
+        else:
+            action = rng.choices(["species_mi", "feature", "tab"], weights=[2, 4, 2])[0]
+
+        if action == "species":
+            session.update("species", species=rng.choice(species))
+        elif action == "activity_type":
+            session.update("activity_type", activity_type=rng.choice(synthetic.ACTIVITY_TYPES))
+        elif action == "opacity":
+            # A drag sends a burst of values as the slider moves
+            for opacity in sorted(rng.uniform(0, 1) for _ in range(5)):
+                session.update("opacity", hsm_opacity=round(opacity, 2))
+        elif action == "species_mi":
+            session.update("species_mi", species_mi=rng.choice(species))
+        elif action == "feature":
+            session.update("feature", feature_mi=rng.choice(features))
+        else:
+            tab = rng.choice([name for name in ("map", "model_interpretation", "models") if name != tab])
+            session.show_tab(tab)
+
+
+def warm_caches(client, species: list[str], features: list[str]):
+    """
+    This function visits every selection once, so the records and plots users ask for are already cached.
+
+    Otherwise the first step of the load test would also measure rendering them.
+    """
+    with SimulatedSession(client, initial_inputs(species[0], features[0])) as session:
+        for latin_name in species:
+            session.update("species", species=latin_name)
+            for activity_type in synthetic.ACTIVITY_TYPES:
+                session.update("activity_type", activity_type=activity_type)
+        session.show_tab("model_interpretation")
+        for latin_name in species:
+            session.update("species_mi", species_mi=latin_name)
+            for feature in features:
+                session.update("feature", feature_mi=feature)
+
+
+def run_load(client, n_sessions: int, steps: int, think_seconds: float, scale: synthetic.Scale, seed: int = 0) -> dict:
+    """
+    This function runs `n_sessions` concurrent sessions against the app and summarises their latency.
+
+    Args:
+        client: TestClient - A client for the app, entered so its event loop is running.
+
+    Returns: dict - The latency percentiles, memory per session and event loop stalls.
+    """
+    from app_config import feature_names
+
+    species = synthetic.species_names(scale.n_species)
+    features = list(feature_names)[: min(scale.n_features, len(feature_names))]
+    # Every session is connected before the memory is measured, and stays connected until it is
+    connected = threading.Barrier(n_sessions + 1)
+    measured = threading.Event()
+    sessions: list[SimulatedSession] = []
+    failures: list[BaseException] = []
+
+    def run_session(index: int):
+        rng = random.Random(seed + index)
+        session = SimulatedSession(client, initial_inputs(rng.choice(species), rng.choice(features)))
+        sessions.append(session)
+        try:
+            session.connect()
+            connected.wait()
+            measured.wait()
+            user_flow(session, rng, steps, species, features, think_seconds)
+        except threading.BrokenBarrierError:
+            pass
+        except BaseException as error:
+            failures.append(error)
+            connected.abort()
+        finally:
+            session.close()
+
+    baseline_rss = rss_bytes()
+    start = time.perf_counter()
+    with EventLoopMonitor(client.portal) as monitor:
+        threads = [threading.Thread(target=run_session, args=(i,), daemon=True) for i in range(n_sessions)]
+        for thread in threads:
+            thread.start()
+        try:
+            connected.wait()
+        except threading.BrokenBarrierError:
+            pass
+        session_rss = rss_bytes() - baseline_rss
+        measured.set()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} sessions failed") from failures[0]
+
+    interactions = [interaction for session in sessions for interaction in session.interactions]
+    updates = [interaction for interaction in interactions if interaction.name != "init"]
+    by_action = {}
+    for interaction in updates:
+        by_action.setdefault(interaction.name.split(":")[0], []).append(interaction.seconds)
+    return {
+        "sessions": n_sessions,
+        "interactions": len(updates),
+        "errors": sum(bool(interaction.errors) for interaction in interactions),
+        "throughput": len(updates) / elapsed,
+        "init": percentiles([interaction.seconds for interaction in interactions if interaction.name == "init"]),
+        "latency": percentiles([interaction.seconds for interaction in updates]),
+        "latency_by_action": {name: percentiles(seconds) for name, seconds in by_action.items()},
+        "rss_per_session_mb": session_rss / n_sessions / 1e6,
+        **monitor.summary(),
+    }
+
+
+def print_report(results: list[dict], max_p95: float):
+    print(
+        f"{'sessions':>8} {'actions':>8} {'errors':>6} {'per s':>7} {'p50':>7} {'p95':>7} {'p99':>7} "
+        f"{'max':>7} {'init p95':>8} {'MB/sess':>8} {'stall':>7} {'stall max':>9}"
+    )
+    for result in results:
+        latency = result["latency"]
+        print(
+            f"{result['sessions']:>8} {result['interactions']:>8} {result['errors']:>6} {result['throughput']:>7.1f} "
+            f"{latency['p50']:>7.3f} {latency['p95']:>7.3f} {latency['p99']:>7.3f} {latency['max']:>7.3f} "
+            f"{result['init']['p95']:>8.3f} {result['rss_per_session_mb']:>8.2f} {result['stall_total']:>7.2f} "
+            f"{result['stall_max']:>9.3f}"
+        )
+
+    largest = max(results, key=lambda result: result["sessions"])
+    print(f"\np95 latency by action at {largest['sessions']} sessions:")
+    for name, latency in sorted(largest["latency_by_action"].items()):
+        print(f"  {name:<22} {latency['p95']:.3f}s")
+
+    steps = sorted(result["sessions"] for result in results)
+    failing = [result["sessions"] for result in results if result["latency"]["p95"] > max_p95]
+    if not failing:
+        print(f"\np95 latency stayed under {max_p95}s up to {largest['sessions']} sessions, try more to find the ceiling.")
+        return
+    # The ceiling is below the first step that failed, whatever happened at larger steps
+    first_failing = min(failing)
+    passing = [n_sessions for n_sessions in steps if n_sessions < first_failing]
+    if passing:
+        print(f"\nThe per-worker ceiling is between {passing[-1]} and {first_failing} sessions: p95 latency passed {max_p95}s at {first_failing}.")
+    else:
+        print(f"\np95 latency passed {max_p95}s at {first_failing} sessions, the fewest tried.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20], help="The numbers of concurrent sessions to run, in turn.")
+    parser.add_argument("--steps", type=int, default=20, help="The number of actions each session takes.")
+    parser.add_argument("--think", type=float, default=0.5, help="The mean seconds a user pauses between actions.")
+    parser.add_argument("--max-p95", type=float, default=0.5, help="The p95 latency in seconds a worker should stay under.")
+    parser.add_argument("--scale", choices=synthetic.SCALES, default="small", help="The size of the synthetic data.")
+    parser.add_argument("--data-dir", type=Path, help="Where to keep the synthetic bucket, reused between runs. Defaults to a temporary directory.")
+    parser.add_argument("--json", type=Path, help="A file to write the full results to.")
+    args = parser.parse_args()
+    json_path = args.json.resolve() if args.json else None
+
+    with tempfile.TemporaryDirectory(prefix="hsm-load-") as temp_dir:
+        work_dir = Path(temp_dir)
+        bucket_dir = prepare_bucket((args.data_dir or work_dir / "bucket").resolve(), args.scale)
+        configure_environment(bucket_dir, work_dir)
+
+        from starlette.testclient import TestClient
+
+        import app
+
+        from app_config import feature_names
+
+        scale = synthetic.SCALES[args.scale]
+        results = []
+        # One event loop for every step, as Shiny's reactive lock is bound to the first loop it runs on
+        with TestClient(app.app) as client:
+            start = time.perf_counter()
+            features = list(feature_names)[: min(scale.n_features, len(feature_names))]
+            warm_caches(client, synthetic.species_names(scale.n_species), features)
+            print(f"Warmed the caches in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            for n_sessions in args.sessions:
+                results.append(run_load(client, n_sessions, args.steps, args.think, scale))
+                print(f"Ran {n_sessions} sessions", file=sys.stderr)
+
+    print_report(results, args.max_p95)
+    if json_path:
+        json_path.write_text(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
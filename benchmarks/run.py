@@ -0,0 +1,269 @@
+"""
+Benchmark the dashboard end to end against synthetic data in a local bucket.
+
+The synthetic data is written to a directory that stands in for the GCS bucket through
+HSM_LOCAL_BUCKET_DIR, so no credentials or network are needed. The suite times:
+
+- the cold start of the app, in fresh interpreters
+- each app data loader, `load_app_data` and the app data bundle
+- `load_predictions` and `write_tif_to_pngs`
+- `calculate_dependence_range` and building an app data snapshot
+- simulated sessions driven through the app's websocket
+
+Each run is appended to a history file with the commit it was run on, and compared with
+the last run at the same scale so regressions show up before a release.
+
+Run from the repository root:
+
+    python benchmarks/run.py --scale small
+    python benchmarks/run.py --scale medium --repeat 5 --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import synthetic
+from sessions import SimulatedSession, initial_inputs
+
+repo_dir = Path(__file__).resolve().parents[1]
+dashboard_dir = repo_dir / "dashboard"
+default_history = Path(__file__).resolve().parent / "history.jsonl"
+
+# Slowdowns smaller than this are noise at any ratio
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    """
+    This function calls a function `repeat` times and gets the median seconds a call took.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def git_commit() -> dict:
+    """
+    This function gets the commit being benchmarked and whether the tree has uncommitted changes.
+    """
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def prepare_bucket(bucket_dir: Path, scale_name: str) -> Path:
+    """
+    This function writes the synthetic data for a scale, unless the directory already holds it.
+    """
+    marker = bucket_dir / "scale.json"
+    scale = synthetic.SCALES[scale_name]
+    if marker.exists() and json.loads(marker.read_text()) == asdict(scale):
+        return bucket_dir
+    start = time.perf_counter()
+    synthetic.write_bucket(bucket_dir, scale)
+    marker.write_text(json.dumps(asdict(scale)))
+    print(f"Wrote {scale_name} synthetic data to {bucket_dir} in {time.perf_counter() - start:.1f}s")
+    return bucket_dir
+
+
+def configure_environment(bucket_dir: Path, work_dir: Path):
+    """
+    This function points the app at the local bucket, in this process and the ones it starts.
+    """
+    os.environ.update(
+        {
+            "HSM_LOCAL_BUCKET_DIR": str(bucket_dir),
+            "ENV_TYPE": "prod",
+            "HSM_RELOAD_INTERVAL_SECONDS": "0",
+            "HSM_SHARED_DATA": "0",
+            "SHARED_DATA_DIR": str(work_dir / "shared"),
+            # Render the plots afresh rather than reading those cached by earlier runs
+            "PLOT_CACHE_DIR": str(work_dir / "plots"),
+        }
+    )
+    sys.path.insert(0, str(dashboard_dir))
+    # The app resolves some paths relative to the working directory, as when it is served
+    os.chdir(dashboard_dir)
+
+
+def benchmark_cold_start(repeat: int) -> dict[str, float]:
+    import startup
+
+    return {"cold_start": statistics.median(startup.run("app")[0] for _ in range(repeat))}
+
+
+def benchmark_data(repeat: int, work_dir: Path) -> dict[str, float]:
+    from app_utils import data
+    from app_utils.snapshot import AppDataSnapshot
+
+    timings = {}
+    loaders = {
+        "results_df": data.load_results_df,
+        "training_data_gdf": data.load_training_data,
+        "partial_dependence_df": data.load_partial_dependence_data,
+        "south_yorkshire": data.load_south_yorkshire,
+        "metadata": data.load_metadata,
+    }
+    for name, loader in loaders.items():
+        timings[f"load:{name}"] = measure(loader, repeat)
+    timings["load_app_data"] = measure(data.load_app_data, repeat)
+
+    bundle_path = work_dir / "app-data-bundle.zip"
+    timings["build_app_data_bundle"] = measure(lambda: data.build_app_data_bundle(bundle_path, upload=True), repeat)
+    timings["load_app_data_bundle"] = measure(lambda: data.load_app_data_bundle(fallback=False), repeat)
+
+    timings["load_predictions"] = measure(data.load_predictions, repeat)
+    dataset = data.load_predictions()
+    png_dir = work_dir / "predictions_png"
+    png_dir.mkdir(exist_ok=True)
+    timings["write_tif_to_pngs"] = measure(
+        lambda: data.write_tif_to_pngs(dataset, png_dir, vmin=0, vmax=1, overwrite=True), repeat
+    )
+
+    app_data, _ = data.load_app_data()
+    partial_dependence_df = app_data["partial_dependence_df"]
+    timings["calculate_dependence_range"] = measure(
+        lambda: data.calculate_dependence_range(partial_dependence_df), repeat
+    )
+    timings["snapshot"] = measure(
+        lambda: AppDataSnapshot(app_data, "benchmark", plot_cache_dir=work_dir / "plots"), repeat
+    )
+    return timings
+
+
+def session_flow(session: SimulatedSession, species: list[str], features: list[str]):
+    """
+    This function plays the interactions of a typical visit: browsing the map, then the models.
+    """
+    for latin_name in species[1:3]:
+        session.update("species", species=latin_name)
+    session.update("activity_type", activity_type="Roost")
+    for opacity in (0.6, 0.4, 0.2):
+        session.update("opacity", hsm_opacity=opacity)
+    session.show_tab("model_interpretation")
+    session.update("species_mi", species_mi=species[-1])
+    for feature in features[1:3]:
+        session.update("feature", feature_mi=feature)
+    session.show_tab("models")
+
+
+def benchmark_sessions(repeat: int, scale: synthetic.Scale) -> dict[str, float]:
+    from starlette.testclient import TestClient
+
+    from app_config import feature_names
+
+    import app
+
+    species = synthetic.species_names(scale.n_species)
+    features = list(feature_names)[: min(scale.n_features, len(feature_names))]
+    seconds: dict[str, list[float]] = {}
+    errors = {}
+    with TestClient(app.app) as client:
+        for _ in range(repeat):
+            with SimulatedSession(client, initial_inputs(species[0], features[0])) as session:
+                session_flow(session, species, features)
+            for interaction in session.interactions:
+                seconds.setdefault(f"session:{interaction.name}", []).append(interaction.seconds)
+                errors.update(interaction.errors)
+    if errors:
+        raise RuntimeError(f"Outputs failed during the simulated sessions: {errors}")
+    return {name: statistics.median(values) for name, values in seconds.items()}
+
+
+def load_history(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+
+
+def compare(current: dict, previous: dict | None, threshold: float) -> list[str]:
+    """
+    This function prints the timings of a run next to the previous run's.
+
+    Args:
+        current: dict - The run just finished.
+        previous: dict | None - The last run at the same scale, if any.
+        threshold: float - The fractional slowdown that counts as a regression, e.g. 0.2 for 20%.
+
+    Returns: list[str] - The names of the timings that regressed.
+    """
+    previous_timings = (previous or {}).get("timings", {})
+    if previous:
+        print(f"Compared with {previous['commit']}{' (dirty)' if previous['dirty'] else ''} at {previous['timestamp']}")
+    print(f"{'benchmark':<40} {'seconds':>10} {'previous':>10} {'change':>8}")
+
+    regressions = []
+    for name, seconds in current["timings"].items():
+        old = previous_timings.get(name)
+        if old is None:
+            print(f"{name:<40} {seconds:>10.4f} {'':>10} {'':>8}")
+            continue
+        change = seconds / old - 1 if old else 0
+        regressed = change > threshold and seconds - old > MIN_REGRESSION_SECONDS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40} {seconds:>10.4f} {old:>10.4f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", choices=synthetic.SCALES, default="small", help="The size of the synthetic data.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of times to run each benchmark.")
+    parser.add_argument("--data-dir", type=Path, help="Where to keep the synthetic bucket, reused between runs. Defaults to a temporary directory.")
+    parser.add_argument("--history", type=Path, default=default_history, help="The file the results are appended to.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="The fractional slowdown that counts as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error if any benchmark regressed.")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["cold_start", "data", "sessions"], help="Groups of benchmarks to skip.")
+    args = parser.parse_args()
+    history_path = args.history.resolve()
+
+    with tempfile.TemporaryDirectory(prefix="hsm-benchmark-") as temp_dir:
+        work_dir = Path(temp_dir)
+        bucket_dir = prepare_bucket((args.data_dir or work_dir / "bucket").resolve(), args.scale)
+        configure_environment(bucket_dir, work_dir)
+
+        timings = {}
+        if "data" not in args.skip:
+            timings.update(benchmark_data(args.repeat, work_dir))
+        if "cold_start" not in args.skip:
+            # After the data benchmarks, so the app starts from the bundle they published
+            timings.update(benchmark_cold_start(args.repeat))
+        if "sessions" not in args.skip:
+            timings.update(benchmark_sessions(args.repeat, synthetic.SCALES[args.scale]))
+
+    run = {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "timings": timings,
+    }
+    previous = next((r for r in reversed(load_history(history_path)) if r["scale"] == args.scale), None)
+    regressions = compare(run, previous, args.threshold)
+
+    history_path.parent.mkdir(exist_ok=True, parents=True)
+    with history_path.open("a") as history:
+        history.write(json.dumps(run) + "\n")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(f"{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Drive simulated user sessions through the app's websocket, as a browser would.
+
+A session sends the same messages as the Shiny client: an `init` message with the
+initial inputs and client data, then an `update` message per interaction.
+
+Every reactive flush sends a message to every session, so the flush that answers an
+update can't be told apart from those caused by other sessions. Instead each message is
+followed by a ping, a call to a method the server doesn't have, which the server answers
+with a tagged error response once it has finished with the message before it. The
+latency of an interaction is the time until that response arrives.
+"""
+import json
+import time
+from dataclasses import dataclass, field
+
+PING_METHOD = "benchmark_ping"
+
+# The outputs on each tab of the app, only the outputs of the visible tab are rendered
+TABS = {
+    "map": ["main_map", "model_description", "zonal_stats_table"],
+    "model_interpretation": ["dependence_summary_table", "partial_dependence_plot"],
+    "models": ["models_table"],
+}
+
+
+def client_data(tab: str = "map") -> dict:
+    """
+    This function builds the client data the browser reports when a tab is shown.
+
+    Args:
+        tab: str - The visible tab, one of TABS.
+
+    Returns: dict - The `.clientdata_*` inputs.
+    """
+    data = {
+        ".clientdata_output_partial_dependence_plot_width": 600,
+        ".clientdata_output_partial_dependence_plot_height": 400,
+        ".clientdata_pixelratio": 1,
+        ".clientdata_url_hostname": "localhost",
+    }
+    for tab_name, outputs in TABS.items():
+        data.update({f".clientdata_output_{output}_hidden": tab_name != tab for output in outputs})
+    return data
+
+
+def initial_inputs(latin_name: str, feature: str, tab: str = "map") -> dict:
+    """
+    This function builds the inputs a session starts with.
+    """
+    return {
+        "species": latin_name,
+        "activity_type": "All",
+        "hsm_opacity": 0.8,
+        "species_mi": latin_name,
+        "activity_type_mi": "All",
+        "feature_mi": feature,
+        **client_data(tab),
+    }
+
+
+@dataclass
+class Interaction:
+    """
+    The outcome of one message sent by a simulated session.
+    """
+
+    name: str
+    seconds: float
+    payload_bytes: int
+    errors: dict = field(default_factory=dict)
+
+
+class SimulatedSession:
+    """
+    One browser session connected to the app through a Starlette TestClient.
+
+    Args:
+        client: TestClient - A client for the app.
+        inputs: dict - The initial inputs, as returned by `initial_inputs`.
+    """
+
+    def __init__(self, client, inputs: dict):
+        self.client = client
+        self.inputs = dict(inputs)
+        self.interactions: list[Interaction] = []
+        self._websocket_context = None
+        self.websocket = None
+        self._pings = 0
+
+    def __enter__(self) -> "SimulatedSession":
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self) -> Interaction:
+        """
+        Open the websocket and send the initial inputs.
+        """
+        self._websocket_context = self.client.websocket_connect("/websocket/")
+        self.websocket = self._websocket_context.__enter__()
+        return self._send("init", {"method": "init", "data": self.inputs})
+
+    def update(self, name: str, **inputs) -> Interaction:
+        """
+        Change some inputs and wait for the outputs to be updated.
+
+        Args:
+            name: str - A label for the interaction, e.g. "species".
+            inputs: Any - The new input values.
+
+        Returns: Interaction - The latency, payload size and any output errors.
+        """
+        self.inputs.update(inputs)
+        return self._send(name, {"method": "update", "data": inputs})
+
+    def show_tab(self, tab: str) -> Interaction:
+        """
+        Switch to a tab, which shows its outputs and hides the others.
+        """
+        return self.update(f"tab:{tab}", **{
+            key: value for key, value in client_data(tab).items() if key.endswith("_hidden")
+        })
+
+    def close(self):
+        if self._websocket_context is not None:
+            self._websocket_context.__exit__(None, None, None)
+            self._websocket_context = None
+            self.websocket = None
+
+    def _send(self, name: str, message: dict) -> Interaction:
+        self._pings += 1
+        ping = {"method": PING_METHOD, "tag": self._pings, "args": []}
+        start = time.perf_counter()
+        self.websocket.send_text(json.dumps(message))
+        self.websocket.send_text(json.dumps(ping))
+        payload_bytes = 0
+        errors = {}
+        while True:
+            text = self.websocket.receive_text()
+            received = json.loads(text)
+            if received.get("response", {}).get("tag") == self._pings:
+                break
+            payload_bytes += len(text)
+            errors.update(received.get("errors") or {})
+        interaction = Interaction(name, time.perf_counter() - start, payload_bytes, errors)
+        self.interactions.append(interaction)
+        return interaction
@@ -0,0 +1,96 @@
+"""
+Benchmark the cold start of the dashboard and profile where its imports spend their time.
+
+Each run imports the app in a fresh interpreter with `-X importtime`, so nothing is shared
+between runs. The report gives the wall time to import the module (which for `app`
+includes loading the app data), and the packages that took longest to import in the
+slowest-to-start run.
+
+Run from the repository root, with the app's environment variables set:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --module app_utils.data --repeat 5
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+dashboard_dir = Path(__file__).resolve().parents[1] / "dashboard"
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+# Prints the seconds taken to import the module, after the import time profile
+TIMER = "import time as t; s = t.perf_counter(); import {module}; print(t.perf_counter() - s)"
+
+
+def parse_import_times(log: str) -> list[tuple[str, int, float, float]]:
+    """
+    This function parses the `-X importtime` profile written to stderr.
+
+    Args:
+        log: str - The stderr of the profiled interpreter.
+
+    Returns: list[tuple[str, int, float, float]] - The module name, nesting depth, self and cumulative milliseconds of each import.
+    """
+    rows = []
+    for line in log.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, len(indent) // 2, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+
+def package_times(rows: list[tuple[str, int, float, float]]) -> dict[str, float]:
+    """
+    This function totals the self time of every module by its top-level package.
+    """
+    totals = {}
+    for name, _, self_ms, _ in rows:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_ms
+    return totals
+
+
+def run(module: str) -> tuple[float, list[tuple[str, int, float, float]]]:
+    """
+    This function imports a module in a fresh interpreter with the import time profile on.
+
+    Returns: tuple - The seconds the import took and the parsed profile.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", TIMER.format(module=module)],
+        cwd=dashboard_dir,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    seconds = float(result.stdout.strip().splitlines()[-1])
+    return seconds, parse_import_times(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="app", help="The module to import, relative to dashboard/.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of fresh interpreters to time.")
+    parser.add_argument("--top", type=int, default=15, help="The number of packages to list.")
+    args = parser.parse_args()
+
+    runs = [run(args.module) for _ in range(args.repeat)]
+    seconds = [run_seconds for run_seconds, _ in runs]
+    print(f"import {args.module}: median {statistics.median(seconds):.2f}s, min {min(seconds):.2f}s, max {max(seconds):.2f}s")
+
+    _, rows = max(runs, key=lambda r: r[0])
+    total_ms = sum(self_ms for _, _, self_ms, _ in rows)
+    print(f"\n{len(rows)} modules imported in {total_ms / 1000:.2f}s")
+    print(f"{'package':<30} {'ms':>8} {'share':>6}")
+    totals = sorted(package_times(rows).items(), key=lambda item: item[1], reverse=True)
+    for package, package_ms in totals[: args.top]:
+        print(f"{package:<30} {package_ms:>8.1f} {package_ms / total_ms:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
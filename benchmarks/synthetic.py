@@ -0,0 +1,227 @@
+"""
+Synthetic app data at configurable scale, laid out like the sygb-data bucket.
+
+`write_bucket` writes every blob the app loads into a local directory that can be served
+with HSM_LOCAL_BUCKET_DIR in place of the real bucket.
+"""
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.warp import transform_bounds
+from shapely.geometry import Polygon
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "dashboard"))
+
+from app_config import feature_names, species_name_mapping  # noqa: E402
+from app_utils.raster import write_band_statistics  # noqa: E402
+
+ACTIVITY_TYPES = ["All", "Roost", "In flight"]
+# The British National Grid extent of the synthetic study area
+ORIGIN_X, ORIGIN_Y = 400000, 420000
+NODATA = -1
+
+
+@dataclass
+class Scale:
+    """
+    The size of each synthetic dataset.
+    """
+
+    n_species: int
+    n_records: int
+    n_features: int
+    n_points: int
+    raster_size: int
+    pixel_size: float = 100
+
+
+SCALES = {
+    "small": Scale(n_species=3, n_records=2_000, n_features=10, n_points=50, raster_size=500),
+    "medium": Scale(n_species=9, n_records=20_000, n_features=34, n_points=100, raster_size=1_000),
+    "large": Scale(n_species=9, n_records=200_000, n_features=34, n_points=100, raster_size=2_000, pixel_size=25),
+}
+
+
+def species_names(n_species: int) -> list[str]:
+    """
+    This function gets the latin names of the synthetic species, real ones first.
+    """
+    names = list(species_name_mapping)
+    return (names + [f"Species {i}" for i in range(len(names), n_species)])[:n_species]
+
+
+def model_names(n_species: int) -> list[tuple[str, str, str]]:
+    """
+    This function gets the (latin_name, activity_type, band_name) of every synthetic model.
+    """
+    return [
+        (latin_name, activity_type, f"{latin_name}_{activity_type}")
+        for latin_name in species_names(n_species)
+        for activity_type in ACTIVITY_TYPES
+    ]
+
+
+def study_area(scale: Scale) -> tuple[float, float, float, float]:
+    """
+    This function gets the (minx, miny, maxx, maxy) of the study area in EPSG:27700.
+    """
+    extent = scale.raster_size * scale.pixel_size
+    return (ORIGIN_X, ORIGIN_Y - extent, ORIGIN_X + extent, ORIGIN_Y)
+
+
+def make_results(scale: Scale, seed: int = 0) -> pd.DataFrame:
+    """
+    This function generates the model results table.
+    """
+    rng = np.random.default_rng(seed)
+    models = model_names(scale.n_species)
+    return pd.DataFrame(
+        {
+            "latin_name": [latin_name for latin_name, _, _ in models],
+            "activity_type": [activity_type for _, activity_type, _ in models],
+            "band_name": [band_name for _, _, band_name in models],
+            "mean_cv_score": rng.uniform(0.6, 0.95, len(models)).round(3),
+            "std_cv_score": rng.uniform(0.01, 0.1, len(models)).round(3),
+            "n_presence": rng.integers(20, 2000, len(models)),
+            "n_background": rng.integers(1000, 10000, len(models)),
+            "folds": 5,
+        }
+    )
+
+
+def make_bat_records(scale: Scale, seed: int = 0) -> gpd.GeoDataFrame:
+    """
+    This function generates bat records clustered around a few roosts, in EPSG:27700.
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = study_area(scale)
+    n_roosts = max(1, scale.n_records // 200)
+    roosts = np.column_stack([rng.uniform(minx, maxx, n_roosts), rng.uniform(miny, maxy, n_roosts)])
+    offsets = rng.normal(scale=(maxx - minx) / 100, size=(scale.n_records, 2))
+    xy = np.clip(roosts[rng.integers(0, n_roosts, scale.n_records)] + offsets, [minx, miny], [maxx, maxy])
+    return gpd.GeoDataFrame(
+        {
+            "latin_name": rng.choice(species_names(scale.n_species), scale.n_records),
+            "activity_type": rng.choice(ACTIVITY_TYPES[1:], scale.n_records),
+        },
+        geometry=gpd.points_from_xy(xy[:, 0], xy[:, 1]),
+        crs=27700,
+    )
+
+
+def make_partial_dependence(scale: Scale, seed: int = 0) -> pd.DataFrame:
+    """
+    This function generates a smooth partial dependence curve for every model and feature.
+    """
+    rng = np.random.default_rng(seed)
+    features = list(feature_names)[: scale.n_features]
+    features += [f"feature_{i}" for i in range(len(features), scale.n_features)]
+    models = model_names(scale.n_species)
+    n_curves = len(models) * len(features)
+
+    values = np.tile(np.linspace(0, 1, scale.n_points), n_curves)
+    # A random mix of a trend and a bump, so the curves have varied shapes
+    slope = np.repeat(rng.normal(size=n_curves), scale.n_points)
+    bump = np.repeat(rng.normal(size=n_curves), scale.n_points)
+    centre = np.repeat(rng.uniform(size=n_curves), scale.n_points)
+    average = slope * values + bump * np.exp(-((values - centre) ** 2) / 0.02)
+    return pd.DataFrame(
+        {
+            "latin_name": np.repeat([latin_name for latin_name, _, _ in models], len(features) * scale.n_points),
+            "activity_type": np.repeat([activity_type for _, activity_type, _ in models], len(features) * scale.n_points),
+            "feature": np.tile(np.repeat(features, scale.n_points), len(models)),
+            "values": values,
+            "average": average,
+        }
+    )
+
+
+def make_boundary(scale: Scale, n_vertices: int = 20_000, seed: int = 0) -> gpd.GeoDataFrame:
+    """
+    This function generates a detailed, wiggly study area boundary, in EPSG:4326 like the published one.
+
+    Real county boundaries follow rivers and field edges, so they have many vertices a few
+    metres apart.
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = study_area(scale)
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    # Smooth large-scale bends plus small-scale jitter
+    radius = 0.45 + 0.03 * np.sin(angles * 7) + 0.01 * np.sin(angles * 53) + rng.normal(0, 0.00005, n_vertices)
+    x = minx + (maxx - minx) * (0.5 + radius * np.cos(angles))
+    y = miny + (maxy - miny) * (0.5 + radius * np.sin(angles))
+    boundary = Polygon(np.column_stack([x, y]))
+    return gpd.GeoDataFrame({"name": ["South Yorkshire"]}, geometry=[boundary], crs=27700).to_crs(4326)
+
+
+def make_prediction_raster(scale: Scale, path: Path, seed: int = 0) -> Path:
+    """
+    This function writes a predictions COG with one smooth int16 band per model and nodata outside a circle.
+    """
+    rng = np.random.default_rng(seed)
+    size = scale.raster_size
+    models = model_names(scale.n_species)
+    rows, cols = np.mgrid[0:size, 0:size] / size
+    outside = (rows - 0.5) ** 2 + (cols - 0.5) ** 2 > 0.25
+
+    profile = dict(
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=len(models),
+        dtype="int16",
+        crs="EPSG:27700",
+        transform=from_origin(ORIGIN_X, ORIGIN_Y, scale.pixel_size, scale.pixel_size),
+        nodata=NODATA,
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        compress="deflate",
+    )
+    with rasterio.open(path, "w", **profile) as dataset:
+        for index, (_, _, band_name) in enumerate(models, start=1):
+            phase = rng.uniform(0, 2 * np.pi, 2)
+            band = 50 + 50 * np.sin(rows * 6 + phase[0]) * np.cos(cols * 6 + phase[1])
+            band = band.round().astype("int16")
+            band[outside] = NODATA
+            dataset.write(band, index)
+            dataset.set_band_description(index, band_name)
+        dataset.build_overviews([2, 4, 8, 16], Resampling.nearest)
+    # As the predictions should be published, see `write_band_statistics`
+    write_band_statistics(path)
+    return path
+
+
+def write_bucket(root: Path, scale: Scale, app_data_folder: str = "app_data", seed: int = 0) -> Path:
+    """
+    This function writes every blob the app loads to a local bucket directory.
+
+    Args:
+        root: Path - The bucket directory, to be served with HSM_LOCAL_BUCKET_DIR.
+        scale: Scale - The size of the data.
+        app_data_folder: str - The folder within the bucket, as returned by `get_env_folder`.
+
+    Returns: Path - The app data folder.
+    """
+    folder = Path(root) / app_data_folder
+    folder.mkdir(exist_ok=True, parents=True)
+
+    make_results(scale, seed).to_csv(folder / "results.csv", index=False)
+    make_bat_records(scale, seed).to_parquet(folder / "bat-records.parquet")
+    make_partial_dependence(scale, seed).to_parquet(folder / "partial-dependence-data.parquet")
+    make_boundary(scale).to_parquet(folder / "boundary.parquet")
+    raster_path = make_prediction_raster(scale, folder / "predictions_cog.tif", seed)
+
+    with rasterio.open(raster_path) as dataset:
+        bbox = transform_bounds(dataset.crs, "EPSG:4326", *dataset.bounds)
+    metadata = {"prediction_bbox": list(bbox), "bbox_crs": 4326}
+    (folder / "metadata.json").write_text(json.dumps(metadata, indent=4))
+    return folder
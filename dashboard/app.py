@@ -1,76 +1,147 @@
 "Main entry point for the dashboard app."
+import os
+import time
 from pathlib import Path
+from urllib.parse import quote
 
-import matplotlib.pyplot as plt
-from shiny import App, render, ui, reactive
+from shiny import App, render, ui, reactive, req
 from ipyleaflet import (
+    DrawControl,
     Map,
-    GeoData,
+    GeoJSON,
     ImageOverlay,
+    Popup,
+    TileLayer,
 )
-from shinywidgets import register_widget, render_widget
-import geopandas as gpd
+from ipywidgets import HTML
+from shapely.geometry import shape
+from shinywidgets import reactive_read, register_widget, render_widget
 import pandas as pd
 from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.routing import Mount
 
 
 # Local imports
 from modules.ui import app_ui
 
-from app_config import species_name_mapping, feature_names, app_dir
+from app_config import (
+    species_name_mapping,
+    feature_names,
+    app_dir,
+    record_cluster_threshold,
+    record_cluster_max_zoom,
+    suitability_threshold,
+)
 from app_utils import load_md_file
-from app_utils.map import generate_basemap, layer_exists, get_layer
+from app_utils.map import generate_basemap, select_pyramid_level, LayerManager, point_scores_html
 from app_utils.data import (
-    load_training_data,
-    load_partial_dependence_data,
-    calculate_dependence_range,
-    load_south_yorkshire,
-    load_metadata,
-    load_results_df, 
+    app_data_version,
+    load_app_data,
+    load_app_data_bundle,
+    load_point_index,
+    load_shared_app_data,
+    load_zonal_stats,
+    predictions_cog_path,
+    query_predictions_at,
 )
-from app_utils.cloud import generate_signed_url, get_env_folder
-from app_utils.geo import project_bbox
+from app_utils.cloud import get_url_signer, get_env_folder, run_io
+from app_utils.metrics import MetricsLog, PayloadSizeMiddleware, instrument, metrics, metrics_app
+from app_utils.tiles import TileRenderer, tile_app
+from app_utils.snapshot import AppDataSnapshot, SnapshotReloader
 app_data_folder = get_env_folder()
+url_signer = get_url_signer("sygb-data")
 
 
 css_path = app_dir / "www" / "styles.css"
 
 load_dotenv()
 
+# Serve the predictions as XYZ tiles rather than a single overlay of the whole extent
+use_tile_server = os.getenv("HSM_TILE_SERVER", "1") == "1"
+tile_renderer = TileRenderer(predictions_cog_path)
 
+# Load the app data from the single packed bundle rather than one blob per asset
+use_data_bundle = os.getenv("HSM_DATA_BUNDLE", "1") == "1"
+# Map one copy of the app data shared by every worker process rather than loading it per process
+use_shared_data = os.getenv("HSM_SHARED_DATA", "0") == "1"
+# Metrics are recorded when HSM_METRICS=1 and shown under /admin to holders of this token
+admin_token = os.getenv("HSM_ADMIN_TOKEN")
+if metrics.enabled and os.getenv("HSM_METRICS_LOG"):
+    MetricsLog(Path(os.getenv("HSM_METRICS_LOG"))).start()
+# How often to check the bucket for newly published data, 0 turns reloading off
+reload_interval_seconds = float(os.getenv("HSM_RELOAD_INTERVAL_SECONDS", 300))
+# Where the rendered partial dependence plots are kept between sessions
+plot_cache_dir = Path(os.getenv("PLOT_CACHE_DIR", app_dir / "data" / "partial_dependence_plots"))
 
 
 
-## Load all static app data ----------
-results_df = load_results_df()
-training_data_gdf = load_training_data()
-partial_dependence_df = load_partial_dependence_data()
-south_yorkshire = load_south_yorkshire()
-
-dependence_range = calculate_dependence_range(partial_dependence_df)
 
-metadata = load_metadata()
+## Load all static app data ----------
+load_static_data = load_app_data_bundle if use_data_bundle else load_app_data
+
+
+def load_snapshot(version: str) -> AppDataSnapshot:
+    """
+    Load a version of the app data and build everything derived from it.
+    """
+    if use_shared_data:
+        app_data, load_timings = load_shared_app_data(load=load_static_data, version=version)
+    else:
+        app_data, load_timings = load_static_data()
+    return AppDataSnapshot(
+        app_data,
+        version,
+        plot_cache_dir=plot_cache_dir,
+        load_timings=load_timings,
+    )
+
+
+def release_predictions(old: AppDataSnapshot, new: AppDataSnapshot):
+    """
+    Drop everything read from the previous predictions once new data is swapped in.
+    """
+    # Fetch a new COG here, off the request path, rather than on the next tile
+    predictions_cog_path()
+    tile_renderer.clear()
+    load_point_index.cache_clear()
+    load_zonal_stats.cache_clear()
+    url_signer.clear()
+
+
+data_reloader = SnapshotReloader(
+    load=load_snapshot,
+    version=lambda: app_data_version(use_data_bundle),
+    interval_seconds=reload_interval_seconds,
+    on_swap=[release_predictions],
+)
+data_reloader.load_initial()
+if reload_interval_seconds > 0:
+    data_reloader.start()
 
 ## save the predictions to PNGs somewhere the app can GET them
 
 png_dir = app_dir / "data" / "predictions_png"
 png_dir.mkdir(exist_ok=True, parents=True)
 
-tif_bounds = metadata["prediction_bbox"]
-tif_crs = metadata["bbox_crs"]
-
 ### App UI
 
-main_app_ui = app_ui(
-    css_path=css_path,
-    species_name_mapping=species_name_mapping,
-    results_df=results_df,
-    
-)
+def main_app_ui(request):
+    # Built per page load so the choices follow the current data
+    return app_ui(
+        css_path=css_path,
+        species_name_mapping=species_name_mapping,
+        results_df=data_reloader.current.results_df,
+    )
 
 show_disclaimer = reactive.Value(True)
 disclaimer_text = load_md_file(app_dir / "text" / "disclaimer.md")
 def server(input, output, session):
+    @reactive.poll(lambda: data_reloader.current.version, 5)
+    def app_data() -> AppDataSnapshot:
+        # Re-runs everything that reads the data once a new version has been swapped in
+        return data_reloader.current
+
     @reactive.effect
     @reactive.event(show_disclaimer)
     def _():
@@ -84,7 +155,9 @@ def server(input, output, session):
         ui.modal_show(m)
 
     @reactive.Calc
+    @instrument()
     def selected_results() -> pd.DataFrame:
+        results_df = app_data().results_df
         return results_df[
             (results_df["latin_name"] == input.species())
             & (results_df["activity_type"] == input.activity_type())
@@ -92,7 +165,9 @@ def server(input, output, session):
 
 
     @reactive.Calc
+    @instrument()
     def partial_dependence_range() -> pd.DataFrame:
+        dependence_range = app_data().dependence_range
         return dependence_range[
             (dependence_range.latin_name == input.species_mi())
             & (dependence_range.activity_type == input.activity_type_mi())
@@ -100,40 +175,31 @@ def server(input, output, session):
 
     @output
     @render.data_frame
+    @instrument()
     def dependence_summary_table():
         pd_df = partial_dependence_range()
         pd_df["average"] = pd_df["average"].round(3)
         pd_df = pd_df[["feature", "average"]].sort_values("average", ascending=False)
-        pd_df.feature.replace(feature_names, inplace=True)
+        pd_df["feature"] = pd_df["feature"].replace(feature_names)
         pd_df.rename(
             columns={"feature": "Feature", "average": "Influence Range"}, inplace=True
         )
         return pd_df
 
-    @reactive.Calc
-    def partial_dependence_df_model():
-        return partial_dependence_df[
-            (partial_dependence_df.latin_name == input.species_mi())
-            & (partial_dependence_df.activity_type == input.activity_type_mi())
-        ].copy()
-
     @output
-    @render.plot
+    @render.image
+    @instrument()
     def partial_dependence_plot():
-        pd_df = partial_dependence_df_model()
-        pd_df = pd_df[pd_df["feature"] == input.feature_mi()]
-        ax = pd_df.plot(x="values", y="average")
-        feature_label = feature_names[input.feature_mi()]
-        ax.set_xlabel(feature_label)
-        ax.set_ylabel("Effect on Habitat Suitability Score")
-        # drop the legend
-        ax.get_legend().remove()
-        # round y axis to 2 decimal places
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f"{x:.2f}"))
-        return ax
+        feature = input.feature_mi()
+        png_path = app_data().partial_dependence_plots.png_path(
+            input.species_mi(), input.activity_type_mi(), feature, feature_names[feature]
+        )
+        req(png_path)
+        return {"src": str(png_path), "width": "100%", "alt": "Partial dependence plot"}
 
     @output
     @render.ui
+    @instrument()
     def model_description():
         model_result = selected_results()
 
@@ -152,89 +218,213 @@ def server(input, output, session):
         return ui.markdown(description)
 
     @reactive.Calc
-    def selected_training_data() -> gpd.GeoDataFrame:
+    @instrument()
+    def selected_training_data() -> pd.DataFrame:
         activity_type = input.activity_type()
         latin_name = input.species()
-        
-        subset_gdf = training_data_gdf[
-            (training_data_gdf["latin_name"] == latin_name)
-        ]
-        # Only filter by activity type is 'All' isn't selected
-        if activity_type != "All":
-            subset_gdf = subset_gdf[
-                (subset_gdf["activity_type"] == activity_type)
-            ]
-        return subset_gdf
 
-    @reactive.Calc
-    def predictions_png_path():
+        # The "All" activity type holds every record for the species
+        return app_data().training_records(latin_name, activity_type)
+
+    # Calls to the bucket run as extended tasks on the storage I/O pool. Unlike an async
+    # calc, which holds Shiny's reactive lock while it waits, a task lets the worker serve
+    # other sessions until its result is ready.
+    @reactive.extended_task
+    @instrument()
+    async def sign_overlay_url(file_path: str) -> str:
+        return await url_signer.sign_async(file_path)
+
+    @reactive.effect
+    @instrument("request_overlay_url")
+    def _():
+        if use_tile_server:
+            return
         band_name = selected_results()["band_name"].values[0]
+        level = prediction_level()
+        sign_overlay_url(f"{app_data_folder}/{level['folder']}/{band_name}.{app_data().prediction_image_format}")
 
-        file_path = f"{app_data_folder}/predictions_png/{band_name}.png"
-        url = generate_signed_url("sygb-data", file_path)
-        return url
+    @reactive.Calc
+    @instrument()
+    def predictions_png_path():
+        # Waits silently until the URL has been signed
+        return sign_overlay_url.result()
 
     @reactive.Calc
-    def map_points():
-        gdf = selected_training_data()
+    @instrument()
+    def map_points() -> dict:
+        latin_name = input.species()
+        activity_type = input.activity_type()
+        # Only dense layers depend on the zoom
+        if len(selected_training_data()) <= record_cluster_threshold:
+            return app_data().records_geojson(latin_name, activity_type)
+        zoom = round(reactive_read(base_map, "zoom"))
+        return app_data().clustered_records_geojson(latin_name, activity_type, min(zoom, record_cluster_max_zoom))
 
-        #gdf = gdf[["geometry"]]
-        return gdf
+    @reactive.Calc
+    @instrument()
+    def predictions_url():
+        if use_tile_server:
+            band_name = selected_results()["band_name"].values[0]
+            # Relative so the tiles resolve under the path the app is deployed at. The data
+            # version makes the layer and browser fetch new tiles after a reload
+            return f"tiles/{quote(band_name)}/{{z}}/{{x}}/{{y}}.png?v={quote(app_data().version)}"
+        return predictions_png_path()
 
     ## Map ----------------------------------------------------------------------
-    base_map = generate_basemap(south_yorkshire)
+    base_map = generate_basemap(data_reloader.current.basemap_template)
     register_widget("map", base_map)
-    
+    map_layers = LayerManager(base_map)
 
-    @output
-    @render_widget
-    def main_map() -> Map:
-        png_url = predictions_png_path()
-
-        if layer_exists(base_map, "HSM Predictions"):
-            old_layer = get_layer(base_map, "HSM Predictions")
-            base_map.remove_layer(old_layer)
-
-        # Get the bounds of the tif
-        sw_corner = [tif_bounds[1], tif_bounds[0]]
-        ne_corner = [tif_bounds[3], tif_bounds[2]]
-        bounds = [sw_corner, ne_corner]
-
-        image_overlay = ImageOverlay(
-            url=png_url,
-            bounds=bounds,
-            name="HSM Predictions",
-            opacity=input.hsm_opacity(),
-        )
+    prediction_level = reactive.Value({"folder": "predictions_png"})
 
+    @reactive.effect
+    @instrument("update_prediction_level")
+    def _():
+        # Only the whole-extent overlay needs a different image per zoom level
+        data = app_data()
+        if use_tile_server or data.prediction_pyramid is None:
+            return
+        zoom = reactive_read(base_map, "zoom")
+        # The same level dict is returned while it fits, so the overlay isn't reloaded
+        prediction_level.set(select_pyramid_level(data.prediction_pyramid, data.tif_bounds, zoom))
+
+    # Each effect below only sends the traits that depend on its inputs, so e.g. dragging
+    # the opacity slider doesn't resend the species records.
+    @reactive.effect
+    @instrument("update_predictions_layer")
+    def _():
+        url = predictions_url()
+        with reactive.isolate():
+            opacity = input.hsm_opacity()
 
-        base_map.add_layer(image_overlay)
+        if use_tile_server:
+            map_layers.upsert(TileLayer, "HSM Predictions", url=url, opacity=opacity)
+        else:
+            # Get the bounds of the tif
+            tif_bounds = app_data().tif_bounds
+            sw_corner = [tif_bounds[1], tif_bounds[0]]
+            ne_corner = [tif_bounds[3], tif_bounds[2]]
+            bounds = [sw_corner, ne_corner]
 
+            map_layers.upsert(ImageOverlay, "HSM Predictions", url=url, bounds=bounds, opacity=opacity)
 
-        # Check if the training data layer is already added
-        layer_name = "Species Records"
-        geo_data = GeoData(
-            geo_dataframe=map_points(), 
-            name="Species Records", 
-            style={'color': 'black', 'radius':6, 'fillColor': '#F96E46', 'opacity':0.8, 'weight':1.3,  'fillOpacity':0.8},
+    @reactive.effect
+    @instrument("update_predictions_opacity")
+    def _():
+        map_layers.set_traits("HSM Predictions", opacity=input.hsm_opacity())
+
+    @reactive.effect
+    @instrument("update_records_layer")
+    def _():
+        map_layers.upsert(
+            GeoJSON,
+            "Species Records",
+            # The features carry their own style, see `record_style`
+            data=map_points(),
+            point_style={'radius': 6},
             hover_style={'fillColor': '#00E8FC' , 'fillOpacity': 1},
         )
 
-        if layer_exists(base_map, layer_name):
-            old_layer = get_layer(base_map, layer_name)
-            base_map.remove_layer(old_layer)
-        
-        base_map.add_layer(geo_data)
-        
+    clicked_location = reactive.Value(None)
+
+    def update_clicked_location(**kwargs):
+        if kwargs.get("type") == "click":
+            # The time makes every click a new value, so clicking the same spot reopens a closed popup
+            clicked_location.set((*kwargs["coordinates"], time.monotonic()))
+
+    @reactive.extended_task
+    @instrument()
+    async def query_point_scores(location: tuple) -> tuple:
+        lat, lon, _ = location
+        # The first query reads the predictions from the bucket to build the point index
+        return location, await run_io(query_predictions_at, lon, lat)
+
+    @reactive.effect
+    @instrument("request_point_scores")
+    def _():
+        location = clicked_location.get()
+        req(location)
+        query_point_scores(location)
+
+    @reactive.effect
+    @instrument("show_point_scores")
+    def _():
+        # Show every model's score where the map was clicked
+        (lat, lon, _), scores = query_point_scores.result()
+        if scores is None:
+            return
+        map_layers.replace(
+            Popup,
+            "HSM Scores",
+            location=(lat, lon),
+            child=HTML(point_scores_html(scores, data_reloader.current.band_labels)),
+            max_height=300,
+        )
 
+    base_map.on_interaction(update_clicked_location)
+
+    ## Drawn area summary ---------------------------------------------------------
+    drawn_area = reactive.Value(None)
+
+    def update_drawn_area(target, action, geo_json):
+        if action == "deleted":
+            drawn_area.set(None)
+        else:
+            drawn_area.set(shape(geo_json["geometry"]))
+
+    draw_control = DrawControl(
+        polygon={"shapeOptions": {"color": "#00E8FC", "fillOpacity": 0.1}},
+        rectangle={"shapeOptions": {"color": "#00E8FC", "fillOpacity": 0.1}},
+        polyline={},
+        circlemarker={},
+    )
+    draw_control.on_draw(update_drawn_area)
+    base_map.add_control(draw_control)
+
+    @reactive.extended_task
+    @instrument()
+    async def summarise_area(area) -> pd.DataFrame:
+        # The first summary reads the predictions from the bucket
+        return await run_io(lambda: load_zonal_stats().compute(area, threshold=suitability_threshold))
+
+    @reactive.effect
+    @instrument("request_area_summary")
+    def _():
+        area = drawn_area.get()
+        req(area)
+        summarise_area(area)
+
+    @output
+    @render.data_frame
+    @instrument()
+    def zonal_stats_table():
+        req(drawn_area.get())
+        band_labels = app_data().band_labels
+        stats = summarise_area.result()
+        stats = stats[stats["band_name"].isin(band_labels)]
+        table = pd.DataFrame(
+            {
+                "Model": stats["band_name"].map(band_labels),
+                "Mean (%)": (stats["mean"] * 100).round(0),
+                "Max (%)": (stats["max"] * 100).round(0),
+                f"Area Above {suitability_threshold:.0%} (ha)": stats["area_above_threshold_ha"].round(1),
+            }
+        )
+        return table.sort_values("Mean (%)", ascending=False)
+
+    @output
+    @render_widget
+    @instrument()
+    def main_map() -> Map:
         return base_map
     
 
     # Model Summary --------------------------------------------------------------
     @output
     @render.data_frame
+    @instrument()
     def models_table():
-        table = results_df[
+        table = app_data().results_df[
             [
                 "latin_name",
                 "activity_type",
@@ -260,4 +450,14 @@ def server(input, output, session):
         return table
 
 
-app = App(main_app_ui, server)
+shiny_app = App(main_app_ui, server)
+
+app = Starlette(
+    routes=[
+        Mount("/tiles", app=tile_app(tile_renderer)),
+        Mount("/admin", app=metrics_app(admin_token)),
+        Mount("/", app=shiny_app),
+    ]
+)
+if metrics.enabled:
+    app = PayloadSizeMiddleware(app)
@@ -50,3 +50,17 @@ feature_names = {
     "ceh-land-cover-100m_Improved grassland_500m" : "Improved Grassland (500m)",
     "ceh-land-cover-100m_Coniferous woodland_500m" : "Coniferous Woodland (500m)",
 }
+
+
+# Species record layers with more points than this are sent as clusters until the map is
+# zoomed in to `record_cluster_max_zoom`
+record_cluster_threshold = 500
+record_cluster_max_zoom = 15
+# The circle marker style of the species records, clusters set their own radius
+record_style = {"radius": 6, "color": "black", "fillColor": "#F96E46", "opacity": 0.8, "weight": 1.3, "fillOpacity": 0.8}
+
+# Score above which an area counts as suitable habitat in the drawn area summary
+suitability_threshold = 0.5
+
+# The study area boundary is simplified to look exact up to this map zoom level
+boundary_simplify_zoom = 14
@@ -0,0 +1,97 @@
+"Pack the app data into a single versioned file that is fetched with one request"
+import hashlib
+import json
+import zipfile
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import geopandas as gpd
+import pandas as pd
+
+# Bump when the layout of the bundle changes, readers reject versions they don't know
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def write_bundle(data: dict[str, Any], path: Path, compression: str = "zstd") -> dict:
+    """
+    Write the app data to a bundle file.
+
+    The bundle is a zip archive holding one Parquet file per table and a manifest with
+    the remaining JSON values, e.g. the metadata. The Parquet files are already
+    compressed, so they are stored in the archive without further compression and can
+    be read without inflating the whole archive.
+
+    Args:
+        data: dict[str, Any] - The app data keyed by asset name, as returned by `load_app_data`. DataFrames and GeoDataFrames become tables, everything else must be JSON serialisable.
+        path: Path - The file to write the bundle to.
+        compression: str - The Parquet compression codec.
+
+    Returns: dict - The bundle manifest.
+    """
+    tables = {}
+    values = {}
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, value in data.items():
+            if not isinstance(value, pd.DataFrame):
+                values[name] = value
+                continue
+            buffer = BytesIO()
+            # GeoDataFrames are written as GeoParquet, with their CRS
+            value.to_parquet(buffer, compression=compression, index=False)
+            file_name = f"{name}.parquet"
+            archive.writestr(file_name, buffer.getvalue())
+            digest.update(buffer.getvalue())
+            tables[name] = {
+                "file": file_name,
+                "geo": isinstance(value, gpd.GeoDataFrame),
+                "rows": len(value),
+            }
+
+        values_json = json.dumps(values, sort_keys=True)
+        digest.update(values_json.encode("utf-8"))
+        manifest = {
+            "format_version": BUNDLE_FORMAT_VERSION,
+            # Changes whenever any of the data does, so it can be used as the data version
+            "version": digest.hexdigest()[:16],
+            "created": datetime.now(timezone.utc).isoformat(),
+            "tables": tables,
+            "values": values,
+        }
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=4))
+    return manifest
+
+
+def read_manifest(source: Path | BinaryIO) -> dict:
+    """
+    Read the manifest of a bundle without reading its tables.
+    """
+    with zipfile.ZipFile(source) as archive:
+        return json.loads(archive.read(MANIFEST_NAME))
+
+
+def read_bundle(source: Path | BinaryIO) -> tuple[dict[str, Any], dict]:
+    """
+    Read all the app data from a bundle.
+
+    Args:
+        source: Path | BinaryIO - The bundle file or an open, seekable file object.
+
+    Returns: tuple[dict[str, Any], dict] - The app data keyed by asset name, and the bundle manifest.
+
+    Raises: ValueError - If the bundle was written in a format version this code doesn't know.
+    """
+    with zipfile.ZipFile(source) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+        if manifest["format_version"] != BUNDLE_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported bundle format version {manifest['format_version']}, expected {BUNDLE_FORMAT_VERSION}."
+            )
+        data = dict(manifest["values"])
+        for name, table in manifest["tables"].items():
+            file_bytes = BytesIO(archive.read(table["file"]))
+            data[name] = gpd.read_parquet(file_bytes) if table["geo"] else pd.read_parquet(file_bytes)
+    return data, manifest
@@ -0,0 +1,154 @@
+"Persistent on-disk cache for blobs downloaded from cloud storage"
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+from dotenv import load_dotenv
+
+from app_config import app_dir
+
+DEFAULT_CACHE_DIR = app_dir / "data" / "blob_cache"
+DEFAULT_MAX_MB = 2048
+
+# Temporary files older than this are left over from a crashed writer
+STALE_TEMP_SECONDS = 60 * 60
+
+
+class BlobCache:
+    """
+    A size-bounded LRU cache of blob contents on local disk.
+
+    Entries are keyed by bucket, blob name and generation, so a new version of a blob
+    never overwrites a copy another process may still be reading. Files are written to a
+    temporary file and moved into place with `os.replace`, so a reader never sees a
+    partial download.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024**2):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+
+    @classmethod
+    def from_env(cls) -> "BlobCache":
+        """
+        Create a cache configured by the BLOB_CACHE_DIR and BLOB_CACHE_MAX_MB environment variables.
+        """
+        load_dotenv(app_dir / ".env")
+        cache_dir = Path(os.getenv("BLOB_CACHE_DIR", DEFAULT_CACHE_DIR))
+        max_mb = int(os.getenv("BLOB_CACHE_MAX_MB", DEFAULT_MAX_MB))
+        return cls(cache_dir=cache_dir, max_bytes=max_mb * 1024**2)
+
+    @staticmethod
+    def _key(bucket_name: str, blob_name: str) -> str:
+        return hashlib.sha256(f"{bucket_name}/{blob_name}".encode("utf-8")).hexdigest()[:32]
+
+    def entry_path(self, bucket_name: str, blob_name: str, generation: int) -> Path:
+        """
+        Return the path a given generation of a blob is stored at.
+        """
+        return self.cache_dir / f"{self._key(bucket_name, blob_name)}-{generation}.blob"
+
+    def _entries(self) -> list[Path]:
+        return [path for path in self.cache_dir.glob("*.blob") if path.is_file()]
+
+    def lookup(self, bucket_name: str, blob_name: str) -> tuple[int, Path] | None:
+        """
+        Find the newest cached generation of a blob.
+
+        Args:
+            bucket_name: str - The name of the bucket.
+            blob_name: str - The name of the blob within the bucket.
+
+        Returns: tuple[int, Path] | None - The generation and local path, or None if the blob isn't cached.
+        """
+        newest = None
+        for path in self.cache_dir.glob(f"{self._key(bucket_name, blob_name)}-*.blob"):
+            generation = int(path.stem.rsplit("-", 1)[1])
+            if newest is None or generation > newest[0]:
+                newest = (generation, path)
+        return newest
+
+    def touch(self, path: Path):
+        """
+        Mark an entry as recently used.
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def store(
+        self,
+        bucket_name: str,
+        blob_name: str,
+        download: Callable[[BinaryIO], int],
+    ) -> Path:
+        """
+        Atomically add a blob to the cache.
+
+        Args:
+            bucket_name: str - The name of the bucket.
+            blob_name: str - The name of the blob within the bucket.
+            download: Callable - Writes the blob contents to the file object it is given and returns the blob generation.
+
+        Returns: Path - The local path of the cached blob.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                generation = download(file)
+            path = self.entry_path(bucket_name, blob_name, generation)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        # Older generations of the same blob can never be served again
+        for old_path in self.cache_dir.glob(f"{self._key(bucket_name, blob_name)}-*.blob"):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+
+        self.evict(keep=path)
+        return path
+
+    def size(self) -> int:
+        """
+        Return the total size of the cached blobs in bytes.
+        """
+        return sum(path.stat().st_size for path in self._entries())
+
+    def evict(self, keep: Path | None = None):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+
+        Args:
+            keep: Path | None - An entry that must not be evicted, e.g. one that was just written.
+        """
+        now = time.time()
+        for tmp_path in self.cache_dir.glob(".tmp-*"):
+            try:
+                if now - tmp_path.stat().st_mtime > STALE_TEMP_SECONDS:
+                    tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
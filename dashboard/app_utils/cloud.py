@@ -1,14 +1,31 @@
 ""
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from io import BytesIO
+from pathlib import Path
+from typing import Callable, TypeVar
 
+from google.api_core.exceptions import NotFound, NotModified
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
-from google.cloud import storage
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timezone, timedelta
 from google.cloud.storage import Client
 from dotenv import load_dotenv
 
 from app_config import app_dir
+from app_utils.cache import BlobCache
+from app_utils.metrics import metrics
+
+# Signed URLs outlast a typical session so overlays can be reloaded without re-signing
+DEFAULT_SIGNED_URL_TTL = 12 * 60 * 60
+# Storage calls made from the event loop run on this many threads, each with its own connection
+DEFAULT_IO_THREADS = 8
+
+T = TypeVar("T")
 
 
 def get_env_folder():
@@ -20,6 +37,14 @@ def get_env_folder():
     }
     return folders[env_type]
 
+def get_local_bucket_dir() -> Path | None:
+    """
+    Get the directory set by HSM_LOCAL_BUCKET_DIR to serve the buckets from instead of GCS, if any.
+    """
+    load_dotenv(app_dir / ".env")
+    local_dir = os.getenv("HSM_LOCAL_BUCKET_DIR")
+    return Path(local_dir) if local_dir else None
+
 def gc_credentials_dict() -> dict:
     load_dotenv(app_dir / ".env")
 
@@ -50,14 +75,59 @@ def gc_credentials_dict() -> dict:
 
 
 
-def generate_signed_url(bucket_name: str, blob_name: str, expiration_time_seconds: int = 60) -> str:
-    #Define the service account key and project id
-    gc_credentials = gc_credentials_dict()
-    project_id= gc_credentials["project_id"]
+def get_io_threads() -> int:
+    """
+    Get the number of threads for storage I/O, set by the GCS_IO_THREADS environment variable.
+    """
+    load_dotenv(app_dir / ".env")
+    return int(os.getenv("GCS_IO_THREADS", DEFAULT_IO_THREADS))
+
+
+@lru_cache(maxsize=1)
+def get_io_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide thread pool that storage calls are offloaded to by `run_io`.
 
-    #create a credential to initialize the Storage client
+    The pool is bounded, so a slow bucket ties up at most GCS_IO_THREADS threads rather
+    than every thread the event loop could otherwise use.
+    """
+    return ThreadPoolExecutor(max_workers=get_io_threads(), thread_name_prefix="gcs_io")
+
+
+async def run_io(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking storage call on the storage I/O pool, without blocking the event loop.
+
+    Args:
+        fn: Callable - The blocking function, e.g. `CloudBucket.get_blob_path`.
+        *args, **kwargs - The arguments to call it with.
+
+    Returns: The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), partial(fn, *args, **kwargs))
+
+
+@lru_cache(maxsize=1)
+def get_storage_client() -> Client:
+    """
+    Get the process-wide storage client.
+
+    Building credentials and a client is relatively slow, so every bucket and signer in
+    the process shares one. Its HTTP connection pool holds a connection for each storage
+    I/O thread, so concurrent calls reuse connections rather than opening new ones.
+    """
+    gc_credentials = gc_credentials_dict()
     credentials = service_account.Credentials.from_service_account_info(gc_credentials)
-    client = storage.Client(project_id,credentials)
+    session = AuthorizedSession(credentials)
+    # Room for the I/O threads plus the threads that load the app data
+    pool_size = get_io_threads() + 8
+    session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return Client(gc_credentials["project_id"], credentials, _http=session)
+
+
+def generate_signed_url(bucket_name: str, blob_name: str, expiration_time_seconds: int = 60) -> str:
+    client = get_storage_client()
 
     #Get the time in UTC
     ini_time_for_now = datetime.now(timezone.utc)
@@ -65,23 +135,229 @@ def generate_signed_url(bucket_name: str, blob_name: str, expiration_time_second
     #Set the expiration time
     expiration_time = ini_time_for_now + timedelta(seconds=expiration_time_seconds) 
 
-    #Initialize the bucket and blob
-    bucket = client.bucket(bucket_name)
-    blob = bucket.get_blob(blob_name)
-
-    #Get the signed URL
+    #Sign the URL locally with the service account key, no request is made to the bucket
+    blob = client.bucket(bucket_name).blob(blob_name)
     url = blob.generate_signed_url(expiration=expiration_time)
     return url
 
 
+class UrlSigner:
+    """
+    Sign URLs for the blobs in a bucket and reuse them until shortly before they expire.
+
+    Args:
+        bucket_name: str - The bucket the blobs are in.
+        ttl_seconds: int - How long each signed URL is valid for.
+        refresh_margin_seconds: int | None - A cached URL is re-signed once it has less than this long left. Defaults to a tenth of the TTL, at most 5 minutes.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        ttl_seconds: int = DEFAULT_SIGNED_URL_TTL,
+        refresh_margin_seconds: int | None = None,
+    ):
+        if refresh_margin_seconds is None:
+            refresh_margin_seconds = min(300, ttl_seconds // 10)
+        if refresh_margin_seconds >= ttl_seconds:
+            raise ValueError("refresh_margin_seconds must be less than ttl_seconds.")
+        self.bucket_name = bucket_name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self.bucket = get_storage_client().bucket(bucket_name)
+        self._urls: dict[str, tuple[str, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def sign(self, blob_name: str) -> str:
+        """
+        Get a signed URL for a blob, reusing a cached one if it is still valid.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = self._urls.get(blob_name)
+        if cached is not None and cached[1] - now > self.refresh_margin:
+            return cached[0]
+
+        expiration_time = now + self.ttl
+        url = self.bucket.blob(blob_name).generate_signed_url(expiration=expiration_time)
+        with self._lock:
+            self._urls[blob_name] = (url, expiration_time)
+        return url
+
+    async def sign_async(self, blob_name: str) -> str:
+        """
+        Get a signed URL for a blob without blocking the event loop, see `sign`.
+
+        Cached URLs are returned directly, only signing a new one uses the storage I/O pool.
+        """
+        with self._lock:
+            cached = self._urls.get(blob_name)
+        if cached is not None and cached[1] - datetime.now(timezone.utc) > self.refresh_margin:
+            return cached[0]
+        return await run_io(self.sign, blob_name)
+
+    def clear(self):
+        """
+        Forget all cached URLs, e.g. after new files have been published.
+        """
+        with self._lock:
+            self._urls.clear()
+
+
+class LocalUrlSigner:
+    """
+    A UrlSigner stand-in that returns file URLs for the blobs of a LocalBucket.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def sign(self, blob_name: str) -> str:
+        return (self.root / blob_name).resolve().as_uri()
+
+    async def sign_async(self, blob_name: str) -> str:
+        return self.sign(blob_name)
+
+    def clear(self):
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_url_signer(bucket_name: str) -> UrlSigner | LocalUrlSigner:
+    """
+    Get the process-wide URL signer for a bucket.
+
+    The TTL of the signed URLs is set by the SIGNED_URL_TTL_SECONDS environment variable.
+    If HSM_LOCAL_BUCKET_DIR is set, the URLs are file URLs into that directory.
+    """
+    local_dir = get_local_bucket_dir()
+    if local_dir is not None:
+        return LocalUrlSigner(local_dir)
+    load_dotenv(app_dir / ".env")
+    ttl_seconds = int(os.getenv("SIGNED_URL_TTL_SECONDS", DEFAULT_SIGNED_URL_TTL))
+    return UrlSigner(bucket_name, ttl_seconds=ttl_seconds)
+
+
 class CloudBucket:
-    def __init__(self, bucket_name: str):
+    def __init__(self, bucket_name: str, cache: BlobCache | None = None):
         self.bucket_name = bucket_name
-        credentials = gc_credentials_dict()
-        self.project_id = credentials["project_id"]
-        self.client = Client(credentials=service_account.Credentials.from_service_account_info(credentials))
+        self.client = get_storage_client()
+        self.project_id = self.client.project
         self.bucket = self.client.bucket(self.bucket_name)
+        self.cache = cache
+
+    def get_blob_path(self, blob_name: str) -> Path:
+        """
+        Get a local path to the current version of a blob.
+
+        The cached copy is revalidated with a conditional GET on its generation, so the
+        blob is only downloaded again if it has changed in the bucket.
+        """
+        if self.cache is None:
+            raise ValueError("A BlobCache is required to get a local path to a blob.")
+
+        cached = self.cache.lookup(self.bucket_name, blob_name)
+        blob = self.bucket.blob(blob_name)
+
+        def download(file) -> int:
+            if cached is None:
+                blob.download_to_file(file)
+            else:
+                blob.download_to_file(file, if_generation_not_match=cached[0])
+            if blob.generation is None:
+                blob.reload()
+            return blob.generation
+
+        try:
+            with metrics.timer("gcs_request_seconds", "get_blob_path"):
+                return self.cache.store(self.bucket_name, blob_name, download)
+        except NotModified:
+            generation, path = cached
+            self.cache.touch(path)
+            return path
+
+    def get_generation(self, blob_name: str) -> int | None:
+        """
+        Get the generation of a blob, which changes whenever it is overwritten, without downloading it.
+
+        Returns: int | None - The generation, or None if the blob doesn't exist.
+        """
+        with metrics.timer("gcs_request_seconds", "get_generation"):
+            blob = self.bucket.get_blob(blob_name)
+        return None if blob is None else blob.generation
+
+    def upload_file(self, blob_name: str, path: Path):
+        """
+        Upload a local file to a blob, replacing any existing version.
+        """
+        with metrics.timer("gcs_request_seconds", "upload_file"):
+            self.bucket.blob(blob_name).upload_from_filename(str(path))
 
     def get_blob_bytes(self, blob_name: str):
+        if self.cache is not None:
+            return BytesIO(self.get_blob_path(blob_name).read_bytes())
         blob = self.bucket.blob(blob_name)
-        return BytesIO(blob.download_as_bytes())
+        with metrics.timer("gcs_request_seconds", "get_blob_bytes"):
+            return BytesIO(blob.download_as_bytes())
+
+    # Async versions for the event loop, which run the calls above on the storage I/O pool
+
+    async def get_blob_path_async(self, blob_name: str) -> Path:
+        return await run_io(self.get_blob_path, blob_name)
+
+    async def get_blob_bytes_async(self, blob_name: str) -> BytesIO:
+        return await run_io(self.get_blob_bytes, blob_name)
+
+    async def get_generation_async(self, blob_name: str) -> int | None:
+        return await run_io(self.get_generation, blob_name)
+
+
+class LocalBucket:
+    """
+    A CloudBucket stand-in that serves blobs from a local directory, for benchmarks and offline development.
+
+    Blob names are paths relative to the directory, and a blob's generation is its file's
+    modification time in nanoseconds, so overwriting a file looks like publishing a new
+    version of the blob.
+
+    Args:
+        root: Path - The directory holding the blobs.
+        bucket_name: str - The name of the bucket being stood in for.
+    """
+
+    def __init__(self, root: Path, bucket_name: str = "local"):
+        self.root = Path(root)
+        self.bucket_name = bucket_name
+        self.cache = None
+
+    def get_blob_path(self, blob_name: str) -> Path:
+        """
+        Get the local path of a blob.
+
+        Raises: NotFound - If the blob doesn't exist, like CloudBucket.
+        """
+        path = self.root / blob_name
+        if not path.is_file():
+            raise NotFound(f"No such blob: {blob_name}")
+        return path
+
+    def get_blob_bytes(self, blob_name: str):
+        return BytesIO(self.get_blob_path(blob_name).read_bytes())
+
+    def get_generation(self, blob_name: str) -> int | None:
+        path = self.root / blob_name
+        return path.stat().st_mtime_ns if path.is_file() else None
+
+    def upload_file(self, blob_name: str, path: Path):
+        target = self.root / blob_name
+        target.parent.mkdir(exist_ok=True, parents=True)
+        target.write_bytes(Path(path).read_bytes())
+
+    async def get_blob_path_async(self, blob_name: str) -> Path:
+        return await run_io(self.get_blob_path, blob_name)
+
+    async def get_blob_bytes_async(self, blob_name: str) -> BytesIO:
+        return await run_io(self.get_blob_bytes, blob_name)
+
+    async def get_generation_async(self, blob_name: str) -> int | None:
+        return await run_io(self.get_generation, blob_name)
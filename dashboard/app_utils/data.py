@@ -1,20 +1,53 @@
 "Functions for loading and processing data for the dashboard"
 import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
-import xarray as xr
-import rioxarray as rxr
-import matplotlib.pyplot as plt
-from matplotlib.cm import get_cmap
-from app_utils.cloud import CloudBucket, get_env_folder
+import pyarrow.parquet as pq
+import shapely
+from google.api_core.exceptions import NotFound
+from app_config import app_dir, boundary_simplify_zoom
+from app_utils.bundle import read_bundle, write_bundle
+from app_utils.cloud import CloudBucket, LocalBucket, get_env_folder, get_local_bucket_dir, get_url_signer
+from app_utils.cache import BlobCache
+from app_utils.shared import SharedDataStore, as_geodataframe, file_lock
+
+# matplotlib, xarray and rasterio are slow to import and aren't needed to start the app, so
+# the functions that use them import them on first use
+if TYPE_CHECKING:
+    import xarray as xr
+    from app_utils.raster import PredictionPointIndex, PredictionRaster
+    from app_utils.zonal import ZonalStats
 
 app_data_folder = get_env_folder()
 
+logger = logging.getLogger(__name__)
 
-app_data_bucket = CloudBucket("sygb-data")
+
+# A local directory can stand in for the bucket, e.g. for benchmarks
+local_bucket_dir = get_local_bucket_dir()
+if local_bucket_dir is not None:
+    app_data_bucket = LocalBucket(local_bucket_dir, "sygb-data")
+else:
+    app_data_bucket = CloudBucket("sygb-data", cache=BlobCache.from_env())
+
+point_index_dir = app_dir / "data" / "point_index"
+# lru_cache doesn't stop the storage I/O threads building the point index at the same time
+_point_index_lock = threading.Lock()
+# Temporary point index files older than this are left by a build that never finished
+STALE_TMP_SECONDS = 60 * 60
+
+# The app data packed into one file by `build_app_data_bundle`
+bundle_blob_name = f"{app_data_folder}/app-data-bundle.zip"
 
 
 def load_metadata():
@@ -45,6 +78,8 @@ def array_to_rgb(array: np.ndarray, colormap="viridis", vmin=None, vmax=None):
     """
     This function converts an array to a RGB array using a colormap.
     """
+    from matplotlib.cm import get_cmap
+
     colormap_fn = get_cmap(colormap)
     # Normalize the band
     array = normalize(array, vmin, vmax)
@@ -54,46 +89,141 @@ def array_to_rgb(array: np.ndarray, colormap="viridis", vmin=None, vmax=None):
 
 
 def write_tif_to_pngs(
-    dataset: xr.Dataset,
+    dataset: "xr.Dataset",
     out_dir: Path,
     colormap="viridis",
     vmin=None,
     vmax=None,
     overwrite=False,
+    image_format="png",
+    compression=6,
+    max_workers: int | None = None,
 ) -> tuple[dict[str, Path], tuple, int]:
     """
     This function converts each band of a tif file to a RGB array and writes it to a PNG file.
+
+    Bands are quantised to uint8 and coloured with a colormap lookup table, and are
+    rendered in parallel across `max_workers` processes.
+
+    Args:
+        image_format: str - Either "png" or "webp".
+        compression: int - The zlib level (0-9) for PNG, or the encoder effort (0-6) for WebP.
     """
-    # Get the band names
-    band_names = dataset.data_vars.keys()
-    output_paths = {}
+    from app_utils.render import write_band_images
 
-    colormap_fn = get_cmap(colormap)
+    output_paths = {}
+    bands = {}
     tif_bounds = dataset.rio.bounds()
     tif_crs = dataset.rio.crs.to_epsg()
     # Loop through each band
-    for band_name in band_names:
-        out_path = out_dir / f"{band_name}.png"
+    for band_name in dataset.data_vars.keys():
+        out_path = out_dir / f"{band_name}.{image_format}"
         output_paths[band_name] = out_path
 
         if out_path.exists() and not overwrite:
             # Skip if the file already exists and user doesn't want to overwrite
             continue
 
-        # Get the band
-        band = dataset[band_name].values
         # flip the y axis to match the tif
-        band = np.flipud(band)
-        # Normalize the band
-        band = normalize(band, vmin, vmax)
-        # apply the colormap to convert to RGD
-        rgb = colormap_fn(band)
-        # Write the PNG file
-        plt.imsave(out_path, rgb)
+        bands[band_name] = np.flipud(dataset[band_name].values)
+
+    write_band_images(
+        bands,
+        out_dir,
+        colormap=colormap,
+        vmin=vmin,
+        vmax=vmax,
+        image_format=image_format,
+        compression=compression,
+        max_workers=max_workers,
+    )
 
     return output_paths, tif_bounds, tif_crs
 
 
+def downsample_nanmean(array: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Downsample a 2D array by averaging blocks of `factor` x `factor` cells, ignoring NaN.
+
+    Edge blocks that are only partly covered by the array are averaged over the cells they
+    contain, and blocks with no valid cells are NaN.
+    """
+    rows, cols = array.shape
+    out_rows, out_cols = -(-rows // factor), -(-cols // factor)
+    padded = np.full((out_rows * factor, out_cols * factor), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = array
+    blocks = padded.reshape(out_rows, factor, out_cols, factor)
+
+    valid = ~np.isnan(blocks)
+    counts = valid.sum(axis=(1, 3))
+    totals = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan).astype(np.float32)
+
+
+def write_tif_to_png_pyramid(
+    dataset: "xr.Dataset",
+    out_dir: Path,
+    n_levels: int = 4,
+    colormap="viridis",
+    image_format="png",
+    compression=6,
+    max_workers: int | None = None,
+    metadata_path: Path | None = None,
+) -> dict:
+    """
+    Write each band of the predictions to a pyramid of images with halving resolution.
+
+    Level 0 is the full resolution image in `out_dir`, as written by `write_tif_to_pngs`,
+    and each further level is written to `out_dir/overview_{factor}`. Every level is scaled
+    by the full resolution band's min and max so the colours match between levels.
+
+    Args:
+        dataset: xr.Dataset - The predictions, as returned by `load_predictions`.
+        out_dir: Path - The local directory of the full resolution images.
+        n_levels: int - The number of levels, including the full resolution one.
+        metadata_path: Path | None - If given, the pyramid manifest is written into this metadata.json.
+
+    Returns: dict - The pyramid manifest.
+    """
+    from app_utils.render import write_band_images
+
+    out_dir = Path(out_dir)
+    bands = {name: np.flipud(dataset[name].values).astype(np.float32) for name in dataset.data_vars.keys()}
+    band_ranges = {name: (float(np.nanmin(band)), float(np.nanmax(band))) for name, band in bands.items()}
+
+    levels = []
+    for level in range(n_levels):
+        factor = 2**level
+        folder = out_dir.name if level == 0 else f"{out_dir.name}/overview_{factor}"
+        level_dir = out_dir.parent / folder
+        level_dir.mkdir(exist_ok=True, parents=True)
+
+        level_bands = bands if factor == 1 else {
+            name: downsample_nanmean(band, factor) for name, band in bands.items()
+        }
+        write_band_images(
+            level_bands,
+            level_dir,
+            colormap=colormap,
+            image_format=image_format,
+            compression=compression,
+            max_workers=max_workers,
+            band_ranges=band_ranges,
+        )
+        height, width = next(iter(level_bands.values())).shape
+        levels.append({"factor": factor, "folder": folder, "width": width, "height": height})
+
+    manifest = {"image_format": image_format, "levels": levels}
+
+    if metadata_path is not None:
+        metadata = json.loads(Path(metadata_path).read_text())
+        metadata["prediction_pyramid"] = manifest
+        Path(metadata_path).write_text(json.dumps(metadata, indent=4))
+
+    return manifest
+
+
 def setup_pngs() -> tuple[dict[str, Path], tuple, int]:
     """
     This function sets up the PNGs for the dashboard.
@@ -146,40 +276,325 @@ def load_results_df() -> pd.DataFrame:
     return results_df
 
 
-def load_training_data() -> gpd.GeoDataFrame:
+def compact_records(records: pd.DataFrame) -> pd.DataFrame:
     """
-    This function loads the training data
+    This function converts bat records to the compact form the app keeps in memory.
+
+    The species and activity type become categories and the points become float32
+    longitude and latitude columns in EPSG:4326, so the records hold no shapely objects
+    and need no reprojection once compacted. Records that are already compact, e.g. read
+    from an app data bundle, are returned with only their dtypes checked.
+
+    Args:
+        records: pd.DataFrame - The records, as a GeoDataFrame in any CRS, a table opened by `SharedDataStore` or already compact.
+
+    Returns: pd.DataFrame - The latin_name, activity_type, lon and lat of each record.
+    """
+    if not {"lon", "lat"}.issubset(records.columns):
+        records = as_geodataframe(records).to_crs(4326)
+        records = pd.DataFrame(
+            {
+                "latin_name": records["latin_name"].to_numpy(),
+                "activity_type": records["activity_type"].to_numpy(),
+                "lon": records.geometry.x.to_numpy(dtype=np.float32),
+                "lat": records.geometry.y.to_numpy(dtype=np.float32),
+            }
+        )
+    # The key columns have few distinct values, so categories make grouping cheap
+    return records.astype(
+        {"latin_name": "category", "activity_type": "category", "lon": np.float32, "lat": np.float32}
+    )
+
+
+def load_training_data() -> pd.DataFrame:
+    """
+    This function loads the training data as compact records, see `compact_records`
     """
     # Load the training data
     blob_name = f"{app_data_folder}/bat-records.parquet"
     with app_data_bucket.get_blob_bytes(blob_name=blob_name) as file_bytes:
-        training_data_gdf = gpd.read_parquet(file_bytes)
-    training_data_gdf = training_data_gdf.to_crs(4326)
+        # The modelling pipeline publishes GeoParquet, which is reprojected here once per
+        # load unless the records have been published in the compact form
+        is_geoparquet = b"geo" in (pq.read_schema(file_bytes).metadata or {})
+        file_bytes.seek(0)
+        training_records = gpd.read_parquet(file_bytes) if is_geoparquet else pd.read_parquet(file_bytes)
     # Return the dataframe
-    return training_data_gdf
+    return compact_records(training_records)
+
+
+def predictions_cog_path() -> Path:
+    """
+    Get a local path to the predictions COG, downloading it only if it has changed.
+    """
+    return app_data_bucket.get_blob_path(f"{app_data_folder}/predictions_cog.tif")
+
+
+def build_records_index(training_records: pd.DataFrame) -> dict[tuple[str, str], pd.DataFrame]:
+    """
+    This function splits the training data into the records for each species and activity type.
+
+    Each species also gets an "All" entry with its records for every activity type, so the
+    records for any selection in the app are a single dictionary lookup.
+
+    Args:
+        training_records: pd.DataFrame - The training data, as returned by `load_training_data`.
+
+    Returns: dict[tuple[str, str], pd.DataFrame] - The records keyed by (latin_name, activity_type).
+    """
+    index = {}
+    for (latin_name, activity_type), records in training_records.groupby(
+        ["latin_name", "activity_type"], observed=True, sort=False
+    ):
+        index[(latin_name, activity_type)] = records
+    for latin_name, records in training_records.groupby("latin_name", observed=True, sort=False):
+        index[(latin_name, "All")] = records
+    return index
+
+
+def record_coordinates(records: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    This function gets the longitude and latitude of point records as float64 arrays.
+
+    Args:
+        records: pd.DataFrame - Compact records, as returned by `load_training_data`, or a GeoDataFrame of points in EPSG:4326.
+
+    Returns: tuple[np.ndarray, np.ndarray] - The longitudes and latitudes.
+    """
+    if isinstance(records, gpd.GeoDataFrame):
+        return records.geometry.x.to_numpy(), records.geometry.y.to_numpy()
+    # Widened before any rounding, as float32 values don't round to short decimals
+    return records["lon"].to_numpy(dtype=np.float64), records["lat"].to_numpy(dtype=np.float64)
+
+
+def records_to_geojson(
+    records: pd.DataFrame,
+    precision: int = 5,
+    columns: list[str] | None = None,
+    style: dict | None = None,
+) -> dict:
+    """
+    This function converts records to a compact GeoJSON feature collection for the map.
+
+    Coordinates are rounded to `precision` decimal places (5 is about 1m in EPSG:4326) and
+    only the requested attribute columns are kept.
+
+    Args:
+        records: pd.DataFrame - Compact records, as returned by `load_training_data`, or a GeoDataFrame in EPSG:4326.
+        precision: int - The number of decimal places to keep in the coordinates.
+        columns: list[str] | None - The attribute columns to keep as feature properties.
+        style: dict | None - A style to put in every point's properties, where a styled GeoJSON layer would put it without copying the data.
+
+    Returns: dict - The GeoJSON feature collection.
+    """
+    columns = columns or []
+    if isinstance(records, gpd.GeoDataFrame) and not (records.geom_type == "Point").all():
+        # Only points have a fast path, other geometries go through shapely
+        records = records[columns + [records.geometry.name]].set_geometry(
+            shapely.set_precision(records.geometry.values, 10**-precision)
+        )
+        return json.loads(records.to_json(drop_id=True))
+
+    # Points are written straight from their coordinates, without building shapely geometry
+    lon, lat = record_coordinates(records)
+    xs = np.round(lon, precision).tolist()
+    ys = np.round(lat, precision).tolist()
+    properties = records[columns].to_dict(orient="records") if columns else [{} for _ in range(len(records))]
+    if style is not None:
+        for feature_properties in properties:
+            feature_properties["style"] = style
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [x, y]},
+            "properties": feature_properties,
+        }
+        for x, y, feature_properties in zip(xs, ys, properties)
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def simplify_boundary(boundary: gpd.GeoDataFrame, zoom: int = boundary_simplify_zoom, precision: int = 5) -> dict:
+    """
+    This function simplifies a boundary and converts it to a compact GeoJSON feature collection for the map.
+
+    Vertices that are within a screen pixel of the simplified outline at `zoom` are dropped,
+    so the outline looks the same at that zoom and below. The simplification preserves
+    topology, so polygons don't collapse or self-intersect.
 
+    Args:
+        boundary: gpd.GeoDataFrame - The boundary, in EPSG:4326.
+        zoom: int - The highest zoom level the outline should look exact at.
+        precision: int - The number of decimal places to keep in the coordinates.
+
+    Returns: dict - The GeoJSON feature collection, without properties.
+    """
+    # Degrees of longitude per web mercator pixel at this zoom
+    tolerance = 360 / (256 * 2**zoom)
+    simplified = shapely.simplify(boundary.geometry.values, tolerance, preserve_topology=True)
+    return records_to_geojson(gpd.GeoDataFrame(geometry=simplified, crs=boundary.crs), precision)
+
+
+def cluster_records(
+    records: pd.DataFrame,
+    zoom: int,
+    cell_size: int = 64,
+    precision: int = 5,
+    style: dict | None = None,
+) -> dict:
+    """
+    This function aggregates point records into clusters on a screen-space grid for a zoom level.
+
+    Records are binned into cells `cell_size` web mercator pixels wide at `zoom`, and each
+    cell becomes one feature at the mean location of its records. The features carry the
+    record count and a circle marker style whose radius grows with the count.
+
+    Args:
+        records: pd.DataFrame - The point records, as for `records_to_geojson`.
+        zoom: int - The map zoom level to cluster for.
+        cell_size: int - The width of the grid cells in screen pixels.
+        precision: int - The number of decimal places to keep in the coordinates.
+        style: dict | None - The style the clusters' radius is added to.
 
-def load_predictions() -> xr.Dataset:
+    Returns: dict - The GeoJSON feature collection of clusters.
+    """
+    lon, lat = record_coordinates(records)
+
+    # Project to web mercator pixel coordinates at this zoom
+    world_size = 256 * 2**zoom
+    x = (lon + 180) / 360 * world_size
+    y = (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * world_size
+    cells = np.floor(x / cell_size).astype(np.int64) * world_size + np.floor(y / cell_size).astype(np.int64)
+
+    _, cluster_ids = np.unique(cells, return_inverse=True)
+    counts = np.bincount(cluster_ids)
+    cluster_lon = np.round(np.bincount(cluster_ids, weights=lon) / counts, precision).tolist()
+    cluster_lat = np.round(np.bincount(cluster_ids, weights=lat) / counts, precision).tolist()
+    radii = np.round(6 + 6 * np.log10(counts), 1).tolist()
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [cluster_x, cluster_y]},
+            "properties": {"count": count, "style": {**(style or {}), "radius": radius}},
+        }
+        for cluster_x, cluster_y, count, radius in zip(cluster_lon, cluster_lat, counts.tolist(), radii)
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def open_predictions(remote: bool = False) -> "PredictionRaster":
+    """
+    Open the predictions COG for lazy, windowed reads.
+
+    Args:
+        remote: bool - Read the COG from the bucket with HTTP range requests through a signed URL, instead of from the local blob cache.
+
+    Returns: PredictionRaster - The opened raster. Close it when finished.
+    """
+    from app_utils.raster import PredictionRaster
+
+    if remote:
+        blob_name = f"{app_data_folder}/predictions_cog.tif"
+        return PredictionRaster(get_url_signer(app_data_bucket.bucket_name).sign(blob_name))
+    return PredictionRaster(predictions_cog_path())
+
+
+def _is_stale_tmp(path: Path) -> bool:
+    """
+    Check whether a `.tmp-{pid}-...` point index file was left by a process that is no longer running.
+
+    Files older than `STALE_TMP_SECONDS` also count, as the pid may be from another host or
+    container sharing the directory, or have been reused.
+    """
+    try:
+        if time.time() - path.stat().st_mtime > STALE_TMP_SECONDS:
+            return True
+        os.kill(int(path.name.split("-")[1]), 0)
+    except (ProcessLookupError, ValueError, IndexError):
+        return True
+    except (FileNotFoundError, PermissionError):
+        # Already gone, or a running process of another user
+        return False
+    return False
+
+
+@lru_cache(maxsize=1)
+def load_point_index() -> "PredictionPointIndex":
+    """
+    Load the memory-mapped point lookup copy of the predictions, building it if needed.
+
+    The copy is named after the COG and its blob generation, so a new model run gets a new
+    copy and older copies are removed. The worker processes on a host take turns under a
+    file lock, so one builds the copy and the others open it.
+    """
+    from app_utils.raster import PredictionPointIndex
+
+    # Read before the COG is opened, so the copy is never named after an older generation
+    # than the data in it. The cached file's name can't be relied on, e.g. LocalBucket
+    # returns the blob's own file.
+    generation = app_data_bucket.get_generation(f"{app_data_folder}/predictions_cog.tif")
+    raster = open_predictions()
+    index_path = point_index_dir / f"{Path(raster.source).stem}-{generation}.npy"
+    point_index_dir.mkdir(exist_ok=True, parents=True)
+    with _point_index_lock, file_lock(point_index_dir / ".lock"):
+        for old_path in point_index_dir.glob("*.npy"):
+            # Temporary files are copies still being written, unless their builder has died
+            if old_path == index_path or (old_path.name.startswith(".tmp-") and not _is_stale_tmp(old_path)):
+                continue
+            old_path.unlink(missing_ok=True)
+        return PredictionPointIndex.build(raster, index_path)
+
+
+def query_predictions_at(lon: float, lat: float) -> dict[str, float] | None:
+    """
+    Get the habitat suitability of every band at a location.
+
+    Args:
+        lon: float - The longitude in EPSG:4326.
+        lat: float - The latitude in EPSG:4326.
+
+    Returns: dict[str, float] | None - The 0-1 score for each band name, or None outside the predictions.
+    """
+    return load_point_index().query(lon, lat)
+
+
+@lru_cache(maxsize=1)
+def load_zonal_stats() -> "ZonalStats":
+    """
+    Load the zonal statistics engine for the predictions, shared by every session.
+    """
+    from app_utils.zonal import ZonalStats
+
+    return ZonalStats(open_predictions())
+
+
+def load_predictions() -> "xr.Dataset":
     """
     Load the model predictions array.
 
     This function loads the tif and processes it to be in the correct format for the dashboard.
+    The tif is opened lazily from the blob cache and each band is read and scaled on its
+    own, so only the float32 result and one raw band are held in memory at once.
     """
-    blob_name = f"{app_data_folder}/predictions_cog.tif"
+    import rioxarray as rxr
+    import xarray as xr
 
-    with app_data_bucket.get_blob_bytes(blob_name=blob_name) as file_bytes:
-        predictions = rxr.open_rasterio(file_bytes)
-        predictions.coords["band"] = list(predictions.attrs["long_name"])
-        # Set the nodata appropriately
-        nodata = -1
-        predictions = predictions.where(predictions >= 0, np.nan)
+    from app_utils.raster import scale_predictions
+
+    predictions = rxr.open_rasterio(predictions_cog_path(), cache=False)
+    band_names = list(predictions.attrs["long_name"])
 
-        # convert to a dataset to allow band name indexing
-        predictions = predictions.to_dataset(dim="band")
-        # Convert back to 0-1
-        predictions = predictions / 100
+    # convert to a dataset to allow band name indexing
+    data_vars = {}
+    for i, band_name in enumerate(band_names):
+        band = predictions.isel(band=i).drop_vars("band")
+        # Set the nodata appropriately and convert back to 0-1
+        data_vars[band_name] = xr.DataArray(
+            scale_predictions(band.values), coords=band.coords, dims=band.dims
+        )
+    predictions.close()
 
-    return predictions
+    return xr.Dataset(data_vars)
 
 
 def load_partial_dependence_data() -> pd.DataFrame:
@@ -195,19 +610,69 @@ def calculate_dependence_range(df: pd.DataFrame) -> pd.DataFrame:
     """
     This function calculates the range of values for each feature.
 
+    The curves are sorted by group and feature value once, and every statistic is a NumPy
+    reduction over the contiguous segment of each group, so no Python runs per group.
+
     Args:
         df: pd.DataFrame - The dataframe of partial dependence values.
 
-    Returns: pd.DataFrame - The dataframe of feature ranges.
+    Returns: pd.DataFrame - The dataframe of feature ranges, one row per latin name, activity type and feature, with columns:
+        average - The range of the average effect (max - min).
+        min, max - The smallest and largest average effect.
+        argmax_value - The feature value with the largest average effect.
+        monotonicity - (steps up - steps down) / steps along the curve, 1 if it only rises and -1 if it only falls.
     """
-    # Group by the latin name, activity type and feature
-    df = (
-        df.groupby(["latin_name", "activity_type", "feature"])["average"]
-        .apply(lambda x: x.max() - x.min())
-        .reset_index()
-    )
+    keys = ["latin_name", "activity_type", "feature"]
+    grouped = df.groupby(keys, sort=True, observed=True)
+    # Rows with a missing key are in no group, and get a NaN code
+    codes = grouped.ngroup().to_numpy(dtype=np.float64)
+    in_group = codes >= 0
+    group_index = grouped.size().index
+    ranges = group_index.to_frame(index=False)
+    if not in_group.any():
+        # reduceat can't reduce empty arrays
+        stats = ["average", "min", "max", "argmax_value", "monotonicity"]
+        return ranges.assign(**{stat: np.array([], dtype=np.float64) for stat in stats})
+
+    # Sort by group, then along each curve
+    codes = codes[in_group].astype(np.int64)
+    values = df["values"].to_numpy(dtype=np.float64)[in_group]
+    average = df["average"].to_numpy(dtype=np.float64)[in_group]
+    order = np.lexsort((values, codes))
+    codes = codes[order]
+    values = values[order]
+    average = average[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    # fmin and fmax skip NaN like pandas does
+    mins = np.fmin.reduceat(average, starts)
+    maxs = np.fmax.reduceat(average, starts)
+
+    # First position in each segment that holds the segment's max
+    positions = np.arange(len(average))
+    is_max = average == maxs[codes]
+    argmax = np.minimum.reduceat(np.where(is_max, positions, len(average)), starts)
+    argmax_value = values[np.minimum(argmax, len(average) - 1)]
+    argmax_value[argmax == len(average)] = np.nan
+
+    # Steps between consecutive points of the same curve
+    steps = np.diff(average)
+    same_curve = codes[1:] == codes[:-1]
+    ups = np.r_[0, (steps > 0) & same_curve]
+    downs = np.r_[0, (steps < 0) & same_curve]
+    n_ups = np.add.reduceat(ups, starts)
+    n_downs = np.add.reduceat(downs, starts)
+    n_steps = np.add.reduceat(np.r_[0, same_curve], starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        monotonicity = np.where(n_steps > 0, (n_ups - n_downs) / n_steps, np.nan)
+
+    ranges["average"] = maxs - mins
+    ranges["min"] = mins
+    ranges["max"] = maxs
+    ranges["argmax_value"] = argmax_value
+    ranges["monotonicity"] = monotonicity
     # Return the dataframe
-    return df
+    return ranges
 
 
 def load_south_yorkshire():
@@ -220,3 +685,172 @@ def load_south_yorkshire():
         boundary = gpd.read_parquet(file_bytes)
     # Return the dataframe
     return boundary
+
+
+class AppDataLoadError(RuntimeError):
+    """
+    Raised when one or more of the app data assets fail to load.
+    """
+
+    def __init__(self, errors: dict[str, BaseException]):
+        self.errors = errors
+        details = "; ".join(f"{name}: {error!r}" for name, error in errors.items())
+        super().__init__(f"Failed to load app data ({details})")
+
+
+def _timed(loader: Callable[[], Any]) -> tuple[Any, float]:
+    start = time.perf_counter()
+    value = loader()
+    return value, time.perf_counter() - start
+
+
+def load_app_data(
+    loaders: dict[str, Callable[[], Any]] | None = None,
+) -> tuple[dict[str, Any], dict[str, float]]:
+    """
+    Load all the static app data concurrently.
+
+    Each loader downloads and parses its asset in its own thread, sharing the
+    `app_data_bucket` storage client, so startup takes as long as the slowest asset
+    rather than the sum of all of them. If any loader fails, the assets that haven't
+    started are cancelled and every failure seen so far is raised together.
+
+    Args:
+        loaders: dict[str, Callable] | None - The loaders to run, keyed by asset name. Defaults to all the app data.
+
+    Returns: tuple[dict[str, Any], dict[str, float]] - The loaded assets and the seconds each one took, keyed by asset name.
+    """
+    if loaders is None:
+        loaders = {
+            "results_df": load_results_df,
+            "training_data_gdf": load_training_data,
+            "partial_dependence_df": load_partial_dependence_data,
+            "south_yorkshire": load_south_yorkshire,
+            "metadata": load_metadata,
+        }
+
+    data = {}
+    timings = {}
+    executor = ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="load_app_data")
+    try:
+        futures = {executor.submit(_timed, loader): name for name, loader in loaders.items()}
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        errors = {
+            futures[future]: future.exception() for future in done if future.exception() is not None
+        }
+        if errors:
+            raise AppDataLoadError(errors)
+
+        for future, name in futures.items():
+            data[name], timings[name] = future.result()
+            logger.info("Loaded %s in %.2fs", name, timings[name])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return data, timings
+
+
+def build_app_data_bundle(out_path: Path, upload: bool = False) -> dict:
+    """
+    Pack the current app data blobs into a single bundle file.
+
+    The data is loaded and processed exactly as the app loads it, e.g. the records are
+    already compact and in EPSG:4326, so none of that work is repeated when the bundle is loaded.
+
+    Args:
+        out_path: Path - The local file to write the bundle to.
+        upload: bool - Whether to upload the bundle to the bucket, where `load_app_data_bundle` looks for it.
+
+    Returns: dict - The bundle manifest.
+    """
+    data, _ = load_app_data()
+    manifest = write_bundle(data, out_path)
+    if upload:
+        app_data_bucket.upload_file(bundle_blob_name, out_path)
+    return manifest
+
+
+def load_app_data_bundle(fallback: bool = True) -> tuple[dict[str, Any], dict[str, float]]:
+    """
+    Load all the static app data from the bundle with a single request.
+
+    The bundle goes through the blob cache, so a restart with an unchanged bundle only
+    makes a conditional GET.
+
+    Args:
+        fallback: bool - Load the separate blobs with `load_app_data` if there is no bundle in the bucket.
+
+    Returns: tuple[dict[str, Any], dict[str, float]] - The loaded assets and load timings, as for `load_app_data`.
+    """
+    start = time.perf_counter()
+    try:
+        path = app_data_bucket.get_blob_path(bundle_blob_name)
+    except NotFound:
+        if not fallback:
+            raise
+        logger.warning("No app data bundle at %s, loading the separate blobs", bundle_blob_name)
+        return load_app_data()
+    data, manifest = read_bundle(path)
+    timings = {"bundle": time.perf_counter() - start}
+    logger.info("Loaded app data bundle %s in %.2fs", manifest["version"], timings["bundle"])
+    return data, timings
+
+
+def app_data_version(use_bundle: bool = True) -> str:
+    """
+    Get a version of the published app data that changes whenever any of it is republished.
+
+    The version is made from the generations of the data blobs and the predictions COG,
+    so checking it only fetches blob metadata.
+
+    Args:
+        use_bundle: bool - Whether the app loads the bundle, rather than the separate blobs.
+
+    Returns: str - The version.
+    """
+    blob_names = [f"{app_data_folder}/predictions_cog.tif"]
+    bundle_generation = app_data_bucket.get_generation(bundle_blob_name) if use_bundle else None
+    if bundle_generation is None:
+        # load_app_data_bundle falls back to the separate blobs when there's no bundle
+        blob_names += [
+            f"{app_data_folder}/{file}"
+            for file in ["results.csv", "bat-records.parquet", "partial-dependence-data.parquet", "boundary.parquet", "metadata.json"]
+        ]
+    generations = [bundle_generation] + [app_data_bucket.get_generation(name) for name in blob_names]
+    return "-".join(str(generation) for generation in generations)
+
+
+def load_shared_app_data(
+    store: SharedDataStore | None = None,
+    load: Callable[[], tuple[dict[str, Any], dict[str, float]]] = load_app_data,
+    version: str | None = None,
+) -> tuple[dict[str, Any], dict[str, float]]:
+    """
+    Load the static app data through a store shared by the worker processes on this host.
+
+    The first process to start loads the data with `load` and publishes it as Arrow
+    files; the others memory-map those files instead of each holding a copy. The
+    geometry of the boundary table stays as WKB until `as_geodataframe` is
+    called on it.
+
+    Args:
+        store: SharedDataStore | None - The store to use, defaults to one configured from the environment.
+        load: Callable - Loads the data in the process that publishes it, e.g. `load_app_data_bundle`.
+        version: str | None - The version of the data wanted, e.g. from `app_data_version`. A snapshot of another version is replaced whatever its age.
+
+    Returns: tuple[dict[str, Any], dict[str, float]] - The loaded assets and load timings, as for `load_app_data`.
+    """
+    store = store or SharedDataStore.from_env()
+    timings = {}
+
+    def loader():
+        data, load_timings = load()
+        timings.update(load_timings)
+        metadata = data.pop("metadata")
+        return data, {"metadata": metadata}
+
+    start = time.perf_counter()
+    tables, extras, published = store.load(loader, version=version)
+    timings["shared_data"] = time.perf_counter() - start
+    logger.info("%s shared app data in %.2fs", "Published" if published else "Mapped", timings["shared_data"])
+    return {**tables, **extras}, timings
@@ -1,3 +1,5 @@
+import numpy as np
+import shapely
 from pyproj import Transformer
 
 def project_bbox(bbox, from_crs, to_crs):
@@ -17,4 +19,24 @@ def project_bbox(bbox, from_crs, to_crs):
     minx, miny = transformer.transform(bbox[0], bbox[1])
     maxx, maxy = transformer.transform(bbox[2], bbox[3])
 
-    return (minx, miny, maxx, maxy)
\ No newline at end of file
+    return (minx, miny, maxx, maxy)
+
+def project_geometry(geometry, from_crs, to_crs):
+    """
+    Project a shapely geometry from one CRS to another.
+
+    Parameters:
+    geometry (shapely.Geometry): The geometry to project, with coordinates in (x, y) / (lon, lat) order.
+    from_crs (str): The current CRS of the geometry.
+    to_crs (str): The CRS to project the geometry to.
+
+    Returns:
+    shapely.Geometry: The projected geometry.
+    """
+    transformer = Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+    def transform_coords(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack([x, y])
+
+    return shapely.transform(geometry, transform_coords)
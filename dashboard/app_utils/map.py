@@ -1,8 +1,9 @@
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 from shiny.ui import tags
-from ipyleaflet import Map
+from ipyleaflet import Map, Layer
 
 
 def layer_exists(
@@ -43,38 +44,195 @@ def get_layer(
     return None
 
 
-from ipyleaflet import Map, basemaps, basemap_to_tiles, GeoData, LayersControl
-def generate_basemap(south_yorkshire: gpd.GeoDataFrame):
-        ## Map ----------------------------------------------------------------------
-    m = Map(width="100%", height="100%", zoom=13)
-    print("Init Map")
-    imagery = basemap_to_tiles(basemaps.Esri.WorldImagery)
-    imagery.base = True
-    imagery.name = "Imagery"
+class LayerManager:
+    """
+    Keep handles to the layers added to a map and update them in place.
+
+    Setting a trait on an existing layer sends only that trait to the browser, whereas
+    removing and re-adding a layer re-sends all of it and rescans `m.layers`.
+    """
 
-    m.add_layer(imagery)
+    def __init__(self, m: Map):
+        self.map = m
+        self.layers: dict[str, Layer] = {}
+
+    def get(self, name: str) -> Layer | None:
+        """
+        Get a layer added by this manager by name.
+        """
+        return self.layers.get(name)
+
+    def upsert(self, layer_type: type, name: str, **traits) -> Layer:
+        """
+        Set traits on the named layer, creating it if it doesn't exist yet.
+
+        Args:
+            layer_type: type - The ipyleaflet layer class, e.g. ImageOverlay.
+            name: str - The name of the layer.
+            **traits - The layer traits. Unchanged values aren't sent to the browser.
+
+        Returns: ipyleaflet.Layer - The updated or newly added layer.
+        """
+        layer = self.layers.get(name)
+        if type(layer) is layer_type:
+            self.set_traits(name, **traits)
+            return layer
 
-    bbox = south_yorkshire.total_bounds
+        new_layer = layer_type(name=name, **traits)
+        if layer is not None:
+            self.map.remove_layer(layer)
+        self.map.add_layer(new_layer)
+        self.layers[name] = new_layer
+        return new_layer
+
+    def replace(self, layer_type: type, name: str, **traits) -> Layer:
+        """
+        Replace the named layer with a new one, e.g. to reopen a popup the user has closed.
+        """
+        self.remove(name)
+        return self.upsert(layer_type, name, **traits)
+
+    def remove(self, name: str):
+        """
+        Remove the named layer from the map, if it exists.
+        """
+        layer = self.layers.pop(name, None)
+        if layer is not None:
+            self.map.remove_layer(layer)
+
+    def set_traits(self, name: str, **traits):
+        """
+        Set traits on the named layer in a single message, if the layer exists.
+        """
+        layer = self.layers.get(name)
+        if layer is None:
+            return
+        with layer.hold_sync():
+            for trait, value in traits.items():
+                setattr(layer, trait, value)
+
+
+def select_pyramid_level(manifest: dict, bbox, zoom: float) -> dict:
+    """
+    Pick the smallest level of a prediction image pyramid that is still sharp at a zoom level.
 
-    m.fit_bounds([[bbox[1], bbox[0]], [bbox[3], bbox[2]]])
+    Args:
+        manifest: dict - The "prediction_pyramid" manifest from the metadata.
+        bbox: tuple - The bounds of the predictions in EPSG:4326, in the format (minx, miny, maxx, maxy).
+        zoom: float - The current zoom of the map.
 
-    m.add_control(LayersControl(position="bottomleft", collapsed=False))
+    Returns: dict - The level, with at least one image pixel per screen pixel where possible.
+    """
+    # Width of the predictions on screen, in web mercator pixels
+    displayed_width = (bbox[2] - bbox[0]) / 360 * 256 * 2**zoom
+    levels = sorted(manifest["levels"], key=lambda level: level["width"])
+    for level in levels:
+        if level["width"] >= displayed_width:
+            return level
+    return levels[-1]
 
-    sy_geo = GeoData(
-        geo_dataframe=south_yorkshire,
-        name="South Yorkshire Boundary",
-        style={
-            "color": "pink",
-            "fillColor": "pink",
-            "opacity": 0.6,
-            "weight": 1.9,
-            "dashArray": "2",
-            "fillOpacity": 0,
-        },
 
+def point_scores_html(scores: dict[str, float], band_labels: dict[str, str]) -> str:
+    """
+    Format the scores from a point query as an HTML table for a map popup.
+
+    Args:
+        scores: dict[str, float] - The 0-1 score for each band name.
+        band_labels: dict[str, str] - The label to show for each band name. Bands without a label are skipped.
+
+    Returns: str - The HTML table, highest scores first.
+    """
+    rows = sorted(
+        (
+            (band_labels[band_name], score)
+            for band_name, score in scores.items()
+            if band_name in band_labels and score == score  # skip NaN
+        ),
+        key=lambda row: row[1],
+        reverse=True,
     )
-    m.add_layer(sy_geo)
+    if not rows:
+        return "<p>No predictions at this location.</p>"
+    cells = "".join(f"<tr><td>{label}</td><td>{score * 100:.0f}%</td></tr>" for label, score in rows)
+    return f"<table><tr><th>Model</th><th>Suitability</th></tr>{cells}</table>"
+
+
+from ipyleaflet import Map, basemaps, GeoJSON, LayersControl, TileLayer
+
 
+def fit_zoom(bbox, width: int = 1000, height: int = 700) -> int:
+    """
+    Get the highest zoom level at which a bounding box fits in a viewport.
+
+    Args:
+        bbox: tuple - The bounds in EPSG:4326, in the format (minx, miny, maxx, maxy).
+        width: int - The width of the viewport in screen pixels.
+        height: int - The height of the viewport in screen pixels.
+
+    Returns: int - The zoom level.
+    """
+    minx, miny, maxx, maxy = bbox
+    # Web mercator y of each latitude, on the same 0-1 scale as the world's width
+    y_south, y_north = (np.arcsinh(np.tan(np.radians(lat))) / (2 * np.pi) for lat in (miny, maxy))
+    zoom_x = np.log2(width / 256 / ((maxx - minx) / 360))
+    zoom_y = np.log2(height / 256 / (y_north - y_south))
+    return int(np.floor(min(zoom_x, zoom_y)))
+
+
+class BasemapTemplate:
+    """
+    The parts of the base map that are the same for every session, prepared once.
+
+    Building the boundary layer from a GeoDataFrame serialises its geometry again for each
+    map, and styling a GeoJSON layer deep copies its data. So the boundary is simplified,
+    serialised and styled here once, and every session's map reuses the same GeoJSON.
+
+    Args:
+        boundary_geojson: dict - The study area boundary, as returned by `simplify_boundary`.
+        bbox: tuple - The bounds of the boundary in EPSG:4326, in the format (minx, miny, maxx, maxy).
+    """
+
+    boundary_style = {
+        "color": "pink",
+        "fillColor": "pink",
+        "opacity": 0.6,
+        "weight": 1.9,
+        "dashArray": "2",
+        "fillOpacity": 0,
+    }
+
+    def __init__(self, boundary_geojson: dict, bbox):
+        # The style goes in each feature's properties, where the layer would put it
+        self.boundary_geojson = {
+            **boundary_geojson,
+            "features": [
+                {**feature, "properties": {**feature["properties"], "style": self.boundary_style}}
+                for feature in boundary_geojson["features"]
+            ],
+        }
+        minx, miny, maxx, maxy = (float(value) for value in bbox)
+        self.bounds = [[miny, minx], [maxy, maxx]]
+        # Starting near the zoom `fit_bounds` settles on saves it stepping there one level at a time
+        self.zoom = fit_zoom((minx, miny, maxx, maxy))
+        # The traits `basemap_to_tiles` would give the layer, as widgets can't be built outside a session
+        imagery = basemaps.Esri.WorldImagery
+        self.imagery_traits = {
+            "url": imagery.build_url(scale_factor="{r}"),
+            "attribution": imagery.get("html_attribution", "") or imagery.get("attribution", ""),
+            "min_zoom": imagery.get("min_zoom", 1),
+            "max_zoom": imagery.get("max_zoom", 18),
+        }
+
+
+def generate_basemap(template: BasemapTemplate) -> Map:
+    """
+    Build a session's base map from the shared template.
+    """
+    m = Map(width="100%", height="100%", zoom=template.zoom)
+    m.add_layer(TileLayer(name="Imagery", base=True, **template.imagery_traits))
+    m.fit_bounds(template.bounds)
+    m.add_control(LayersControl(position="bottomleft", collapsed=False))
+    m.add_layer(GeoJSON(data=template.boundary_geojson, name="South Yorkshire Boundary"))
     return m
 
 
@@ -0,0 +1,403 @@
+"Opt-in instrumentation of the reactive graph, client payloads and cloud storage calls"
+import functools
+import hmac
+import html
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from app_config import app_dir
+
+# The most recent samples of each series kept for percentiles
+RESERVOIR_SIZE = 1024
+
+
+class Series:
+    """
+    The running count, sum and max of a measurement, with recent samples for percentiles.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque[float] = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def summary(self) -> dict:
+        p50, p95, p99 = np.percentile(self.samples, [50, 95, 99]) if self.samples else (0.0, 0.0, 0.0)
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
+
+
+class Metrics:
+    """
+    A thread-safe registry of counters and measurement series, keyed by metric and label.
+
+    Every method returns immediately when the registry is disabled, so instrumented code
+    costs next to nothing unless instrumentation has been turned on.
+
+    Args:
+        enabled: bool - Whether to record anything.
+    """
+
+    # Metric name: (help text, label name)
+    SERIES = {
+        "reactive_duration_seconds": ("Wall-clock time of each reactive calc or render function run", "name"),
+        "payload_bytes": ("Size of each output value sent to the client", "output"),
+        "gcs_request_seconds": ("Latency of cloud storage calls", "operation"),
+    }
+    COUNTERS = {
+        "reactive_invalidations_total": ("Invalidations of each reactive calc or render function", "name"),
+        "reactive_errors_total": ("Runs of each reactive calc or render function that raised", "name"),
+    }
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._series: dict[tuple[str, str], Series] = {}
+        self._counters: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        """
+        Create a registry that is enabled when the HSM_METRICS environment variable is "1".
+        """
+        load_dotenv(app_dir / ".env")
+        return cls(enabled=os.getenv("HSM_METRICS", "0") == "1")
+
+    def observe(self, metric: str, label: str, value: float):
+        """
+        Record a measurement of a series.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._series.setdefault((metric, label), Series()).observe(value)
+
+    def increment(self, metric: str, label: str, amount: int = 1):
+        """
+        Add to a counter.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(metric, label)] = self._counters.get((metric, label), 0) + amount
+
+    @contextmanager
+    def timer(self, metric: str, label: str):
+        """
+        Record the wall-clock time of a block of code, in seconds.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, label, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        """
+        Get every metric as a JSON serialisable dictionary.
+        """
+        with self._lock:
+            series = {key: value.summary() for key, value in self._series.items()}
+            counters = dict(self._counters)
+        result = {"time": time.time(), "uptime_seconds": time.time() - self.started}
+        for (metric, label), summary in sorted(series.items()):
+            result.setdefault(metric, {})[label] = summary
+        for (metric, label), count in sorted(counters.items()):
+            result.setdefault(metric, {})[label] = count
+        return result
+
+    def prometheus_text(self, prefix: str = "hsm") -> str:
+        """
+        Get every metric in the Prometheus text exposition format.
+
+        Series are exported as summaries with 0.5, 0.95 and 0.99 quantiles over the most
+        recent samples.
+        """
+        data = self.to_dict()
+        lines = []
+        for metric, (help_text, label_name) in self.SERIES.items():
+            name = f"{prefix}_{metric}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            for label, summary in data.get(metric, {}).items():
+                label_value = _escape_label(label)
+                for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                    lines.append(f'{name}{{{label_name}="{label_value}",quantile="{quantile}"}} {summary[key]}')
+                lines.append(f'{name}_sum{{{label_name}="{label_value}"}} {summary["sum"]}')
+                lines.append(f'{name}_count{{{label_name}="{label_value}"}} {summary["count"]}')
+        for metric, (help_text, label_name) in self.COUNTERS.items():
+            name = f"{prefix}_{metric}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for label, count in data.get(metric, {}).items():
+                lines.append(f'{name}{{{label_name}="{_escape_label(label)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Forget every recorded metric.
+        """
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# The process-wide registry, off unless HSM_METRICS=1
+metrics = Metrics.from_env()
+
+
+def _is_silent(error: Exception) -> bool:
+    # req() stops outputs with these exceptions, which aren't errors
+    from shiny.types import SilentCancelOutputException, SilentException
+
+    return isinstance(error, (SilentException, SilentCancelOutputException))
+
+
+def instrument(name: str | None = None, registry: Metrics | None = None) -> Callable:
+    """
+    Record the run time and invalidations of a reactive calc, effect or render function.
+
+    Apply it beneath the shiny decorator so it wraps the user function, e.g.
+
+        @reactive.Calc
+        @instrument()
+        def selected_results(): ...
+
+    Each run registers an invalidation callback on the current reactive context, so the
+    invalidation count includes the ones that don't lead to a re-run, e.g. for outputs
+    that are hidden.
+
+    Args:
+        name: str | None - The label to record the function under, defaults to its name.
+        registry: Metrics | None - The registry to record to, defaults to the process-wide one.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        label = name or fn.__name__
+
+        def on_start():
+            registry_ = registry or metrics
+            if not registry_.enabled:
+                return registry_
+            from shiny.reactive import get_current_context
+
+            try:
+                get_current_context().on_invalidate(
+                    lambda: registry_.increment("reactive_invalidations_total", label)
+                )
+            except RuntimeError:
+                # Called outside a reactive context
+                pass
+            return registry_
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                registry_ = on_start()
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception as error:
+                    if not _is_silent(error):
+                        registry_.increment("reactive_errors_total", label)
+                    raise
+                finally:
+                    registry_.observe("reactive_duration_seconds", label, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            registry_ = on_start()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as error:
+                if not _is_silent(error):
+                    registry_.increment("reactive_errors_total", label)
+                raise
+            finally:
+                registry_.observe("reactive_duration_seconds", label, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class PayloadSizeMiddleware:
+    """
+    ASGI middleware recording the size of every output value Shiny sends over its websocket.
+
+    Shiny sends output values as JSON messages with a "values" object keyed by output
+    name, so each value is measured and attributed to its output. Custom messages, e.g.
+    the widget updates shinywidgets sends for the map, are recorded as "custom:{type}".
+    Messages are only parsed when the registry is enabled.
+
+    Args:
+        app: The ASGI app to wrap.
+        registry: Metrics | None - The registry to record to, defaults to the process-wide one.
+    """
+
+    def __init__(self, app, registry: Metrics | None = None):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        registry = self.registry or metrics
+        if scope["type"] != "websocket" or not registry.enabled:
+            return await self.app(scope, receive, send)
+
+        async def measured_send(message):
+            if message["type"] == "websocket.send" and message.get("text"):
+                self.record(registry, message["text"])
+            await send(message)
+
+        return await self.app(scope, receive, measured_send)
+
+    @staticmethod
+    def record(registry: Metrics, text: str):
+        if '"values"' not in text and '"custom"' not in text:
+            return
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        for output_name, value in (message.get("values") or {}).items():
+            registry.observe("payload_bytes", output_name, len(json.dumps(value)))
+        for message_type, value in (message.get("custom") or {}).items():
+            registry.observe("payload_bytes", f"custom:{message_type}", len(json.dumps(value)))
+
+
+class MetricsLog:
+    """
+    Append a snapshot of the metrics to a JSON lines file at a fixed interval.
+
+    Args:
+        path: Path - The file to append to.
+        interval_seconds: float - How often to write a snapshot.
+        registry: Metrics | None - The registry to snapshot, defaults to the process-wide one.
+    """
+
+    def __init__(self, path: Path, interval_seconds: float = 60, registry: Metrics | None = None):
+        self.path = Path(path)
+        self.interval_seconds = interval_seconds
+        self.registry = registry or metrics
+        self._stop = threading.Event()
+
+    def write(self):
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(self.registry.to_dict()) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.write()
+
+    def start(self):
+        threading.Thread(target=self._run, name="metrics_log", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def _authorised(request: Request, token: str) -> bool:
+    supplied = request.query_params.get("token", "")
+    header = request.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        supplied = header[len("bearer "):]
+    return hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8"))
+
+
+def _dashboard_html(data: dict) -> str:
+    sections = [
+        f"<h1>HSM App Metrics</h1><p>Uptime {data['uptime_seconds'] / 60:.0f} minutes. Times in milliseconds.</p>"
+    ]
+    for metric, (help_text, label_name) in Metrics.SERIES.items():
+        scale, unit = (1000, "ms") if metric.endswith("seconds") else (1, "")
+        rows = "".join(
+            f"<tr><td>{html.escape(label)}</td><td>{summary['count']}</td>"
+            + "".join(f"<td>{summary[key] * scale:.1f}</td>" for key in ("p50", "p95", "p99", "max"))
+            + "</tr>"
+            for label, summary in sorted(
+                data.get(metric, {}).items(), key=lambda item: item[1]["sum"], reverse=True
+            )
+        )
+        header = "".join(f"<th>{column} {unit}</th>" for column in ("p50", "p95", "p99", "max"))
+        sections.append(
+            f"<h2>{html.escape(help_text)}</h2><table><tr><th>{label_name}</th><th>count</th>{header}</tr>{rows}</table>"
+        )
+    for metric, (help_text, label_name) in Metrics.COUNTERS.items():
+        rows = "".join(
+            f"<tr><td>{html.escape(label)}</td><td>{count}</td></tr>"
+            for label, count in sorted(data.get(metric, {}).items(), key=lambda item: item[1], reverse=True)
+        )
+        sections.append(f"<h2>{html.escape(help_text)}</h2><table><tr><th>{label_name}</th><th>count</th></tr>{rows}</table>")
+    style = "body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}td:first-child{text-align:left}"
+    return f"<html><head><title>HSM App Metrics</title><style>{style}</style></head><body>{''.join(sections)}</body></html>"
+
+
+def metrics_app(token: str | None, registry: Metrics | None = None) -> Starlette:
+    """
+    Create an ASGI app serving the metrics to admins.
+
+    Serves an HTML dashboard at `/`, Prometheus text at `/metrics` and JSON at
+    `/metrics.json`. Every route needs the admin token, as a `token` query parameter or a
+    bearer token, and every route is a 404 when no token is configured.
+
+    Args:
+        token: str | None - The admin token, e.g. from the HSM_ADMIN_TOKEN environment variable.
+        registry: Metrics | None - The registry to serve, defaults to the process-wide one.
+    """
+
+    def guarded(endpoint: Callable[[Metrics], Response]) -> Callable:
+        async def route(request: Request) -> Response:
+            if not token:
+                return Response(status_code=404)
+            if not _authorised(request, token):
+                return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+            return endpoint(registry or metrics)
+
+        return route
+
+    routes = [
+        Route("/", guarded(lambda registry_: HTMLResponse(_dashboard_html(registry_.to_dict())))),
+        Route("/metrics", guarded(lambda registry_: PlainTextResponse(registry_.prometheus_text()))),
+        Route("/metrics.json", guarded(lambda registry_: JSONResponse(registry_.to_dict()))),
+    ]
+    return Starlette(routes=routes)
@@ -0,0 +1,152 @@
+"Partial dependence curves and cached renders of their plots"
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Bump to invalidate cached plots when the plot style changes
+PLOT_VERSION = "1"
+DEFAULT_MAX_MB = 256
+# Temporary files older than this are left over from a crashed render
+STALE_TEMP_SECONDS = 60 * 60
+
+
+class PartialDependenceCurves:
+    """
+    The partial dependence curves as NumPy arrays, indexed by (latin_name, activity_type, feature).
+
+    Args:
+        partial_dependence_df: pd.DataFrame - The partial dependence data, as returned by `load_partial_dependence_data`.
+    """
+
+    def __init__(self, partial_dependence_df: pd.DataFrame):
+        values = partial_dependence_df["values"].to_numpy(dtype=np.float64)
+        average = partial_dependence_df["average"].to_numpy(dtype=np.float64)
+        groups = partial_dependence_df.groupby(
+            ["latin_name", "activity_type", "feature"], sort=False, observed=True
+        ).indices
+        self.curves: dict[tuple[str, str, str], tuple[np.ndarray, np.ndarray]] = {
+            key: (values[rows], average[rows]) for key, rows in groups.items()
+        }
+
+    def get(self, latin_name: str, activity_type: str, feature: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Get the feature values and average effect of a curve, or None if there isn't one.
+        """
+        return self.curves.get((latin_name, activity_type, feature))
+
+
+class PartialDependencePlots:
+    """
+    Render partial dependence plots to PNG files, once per distinct curve.
+
+    Plots are named by a hash of the curve and its label, so a repeat view of a selection,
+    from any session or worker, reuses the file and does no plotting. New model runs
+    produce new curves and so new files, so the directory is kept to `max_bytes` by
+    removing the least recently used plots, like `BlobCache`.
+
+    Args:
+        curves: PartialDependenceCurves - The curves to plot.
+        cache_dir: Path - The directory to keep the rendered plots in.
+        max_bytes: int | None - The size to keep the directory under, defaults to the PLOT_CACHE_MAX_MB environment variable or 256MB.
+    """
+
+    def __init__(
+        self,
+        curves: PartialDependenceCurves,
+        cache_dir: Path,
+        figsize=(6, 4),
+        dpi=100,
+        max_bytes: int | None = None,
+    ):
+        self.curves = curves
+        self.cache_dir = Path(cache_dir)
+        self.figsize = figsize
+        self.dpi = dpi
+        if max_bytes is None:
+            max_bytes = int(os.getenv("PLOT_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024**2
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+
+    def png_path(self, latin_name: str, activity_type: str, feature: str, feature_label: str) -> Path | None:
+        """
+        Get the path of the plot for a selection, rendering it if it hasn't been already.
+
+        Returns: Path | None - The PNG path, or None if there is no curve for the selection.
+        """
+        curve = self.curves.get(latin_name, activity_type, feature)
+        if curve is None:
+            return None
+        x, y = curve
+
+        key = hashlib.sha1()
+        for part in (PLOT_VERSION, feature_label, str(self.figsize), str(self.dpi)):
+            key.update(part.encode("utf-8"))
+        key.update(x.tobytes())
+        key.update(y.tobytes())
+        path = self.cache_dir / f"{key.hexdigest()}.png"
+
+        try:
+            # Marks the plot as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            self._render(x, y, feature_label, path)
+            self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Path | None = None):
+        """
+        Remove the least recently used plots until the directory fits in `max_bytes`.
+
+        Args:
+            keep: Path | None - A plot that must not be removed, e.g. one that was just rendered.
+        """
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.iterdir():
+            try:
+                stat = path.stat()
+                if path.name.startswith(".tmp-"):
+                    if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                        path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def _render(self, x: np.ndarray, y: np.ndarray, feature_label: str, path: Path):
+        # matplotlib is slow to import and cached plots don't need it
+        from matplotlib.figure import Figure
+        from matplotlib.ticker import FuncFormatter
+
+        # Figure rather than pyplot, so no global state is shared between sessions
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        ax = fig.subplots()
+        ax.plot(x, y)
+        ax.set_xlabel(feature_label)
+        ax.set_ylabel("Effect on Habitat Suitability Score")
+        # round y axis to 2 decimal places
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda value, _: f"{value:.2f}"))
+        fig.tight_layout()
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=".png")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                fig.savefig(file, format="png")
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
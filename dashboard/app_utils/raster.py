@@ -0,0 +1,234 @@
+"Lazy, windowed access to the predictions raster"
+import math
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from pyproj import Transformer
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.windows import Window, from_bounds
+
+# Predictions are stored as integer percentages, with negative values for no data
+PREDICTION_SCALE = 100
+
+
+def scale_predictions(raw: np.ndarray) -> np.ndarray:
+    """
+    Convert stored integer predictions to float32 values between 0 and 1, with NaN for no data.
+    """
+    scaled = raw.astype(np.float32)
+    scaled /= PREDICTION_SCALE
+    scaled[raw < 0] = np.nan
+    return scaled
+
+
+def write_band_statistics(path: Path, block_rows: int = 1024) -> dict[str, tuple[int, int]]:
+    """
+    Store the exact min and max of every band of a predictions raster as GDAL statistics tags.
+
+    The tile server scales each band by these, see `TileRenderer`, so they should be written
+    to the predictions COG before it is published. No-data values are left out, and bands
+    with no data at all get no tags.
+
+    Args:
+        path: Path - The raster, which is updated in place.
+        block_rows: int - The number of rows read at a time.
+
+    Returns: dict[str, tuple[int, int]] - The stored (min, max) of each band, in stored units.
+    """
+    with rasterio.open(path, "r+") as dataset:
+        dtype = np.dtype(dataset.dtypes[0])
+        info = np.iinfo(dtype) if dtype.kind in "iu" else np.finfo(dtype)
+        mins = np.full(dataset.count, info.max, dtype=dtype)
+        maxs = np.full(dataset.count, info.min, dtype=dtype)
+        for row_off in range(0, dataset.height, block_rows):
+            height = min(block_rows, dataset.height - row_off)
+            block = dataset.read(window=Window(0, row_off, dataset.width, height))
+            valid = block >= 0
+            mins = np.minimum(mins, np.where(valid, block, info.max).min(axis=(1, 2)))
+            maxs = np.maximum(maxs, np.where(valid, block, info.min).max(axis=(1, 2)))
+
+        statistics = {}
+        for index, (name, band_min, band_max) in enumerate(zip(dataset.descriptions, mins, maxs), start=1):
+            if band_min > band_max:
+                continue
+            dataset.update_tags(index, STATISTICS_MINIMUM=str(band_min), STATISTICS_MAXIMUM=str(band_max))
+            statistics[name] = (band_min.item(), band_max.item())
+    return statistics
+
+
+class PredictionRaster:
+    """
+    Read windows and overviews of the predictions COG without loading the whole stack.
+
+    The source can be a local file, e.g. the cached blob from `predictions_cog_path`, or an
+    http(s) URL such as a signed URL, which GDAL reads with range requests. Values keep the
+    stored integer dtype unless `scaled=True` is passed to `read`.
+
+    Args:
+        source: str | Path - The path or URL of the COG.
+    """
+
+    def __init__(self, source: str | Path):
+        self.source = source
+        self._dataset = rasterio.open(source)
+        self.band_names: list[str] = list(self._dataset.descriptions)
+        # rasterio datasets aren't thread safe
+        self._lock = threading.Lock()
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        return tuple(self._dataset.bounds)
+
+    @property
+    def crs(self):
+        return self._dataset.crs
+
+    @property
+    def transform(self):
+        return self._dataset.transform
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self._dataset.height, self._dataset.width)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self._dataset.dtypes[0])
+
+    def band_indexes(self, band_names: list[str] | None = None) -> list[int]:
+        """
+        Get the 1-based rasterio indexes of bands by name, or of every band if no names are given.
+
+        Raises: KeyError - If a band name isn't in the raster.
+        """
+        if band_names is None:
+            return list(range(1, len(self.band_names) + 1))
+        lookup = {name: index for index, name in enumerate(self.band_names, start=1)}
+        return [lookup[name] for name in band_names]
+
+    def window(self, bounds: tuple[float, float, float, float]) -> Window:
+        """
+        Get the window of the raster covering bounds in the raster's CRS, clipped to the raster.
+
+        Returns: Window - The window, with zero width and height if the bounds are outside the raster.
+        """
+        window = from_bounds(*bounds, transform=self.transform).round_offsets().round_lengths()
+        full = Window(0, 0, self._dataset.width, self._dataset.height)
+        try:
+            return window.intersection(full)
+        except WindowError:
+            return Window(0, 0, 0, 0)
+
+    def read(
+        self,
+        band_names: list[str] | None = None,
+        window: Window | None = None,
+        out_shape: tuple[int, int] | None = None,
+        scaled: bool = False,
+        resampling: Resampling = Resampling.nearest,
+    ) -> np.ndarray:
+        """
+        Read a window of some or all bands.
+
+        Args:
+            band_names: list[str] | None - The bands to read, defaults to all of them.
+            window: Window | None - The window to read, defaults to the full extent.
+            out_shape: tuple[int, int] | None - The (rows, cols) to resample to. GDAL reads from the COG overviews when this is smaller than the window.
+            scaled: bool - Whether to convert the stored values to 0-1 floats with `scale_predictions`.
+            resampling: Resampling - The resampling used when out_shape differs from the window.
+
+        Returns: np.ndarray - A (bands, rows, cols) array.
+        """
+        indexes = self.band_indexes(band_names)
+        if out_shape is not None:
+            out_shape = (len(indexes), *out_shape)
+        with self._lock:
+            data = self._dataset.read(indexes, window=window, out_shape=out_shape, resampling=resampling)
+        return scale_predictions(data) if scaled else data
+
+    def read_overview(self, factor: int, band_names: list[str] | None = None, scaled: bool = False) -> np.ndarray:
+        """
+        Read the full extent downsampled by `factor`, from the matching COG overview if there is one.
+        """
+        rows, cols = self.shape
+        out_shape = (-(-rows // factor), -(-cols // factor))
+        return self.read(band_names, out_shape=out_shape, scaled=scaled)
+
+    def close(self):
+        with self._lock:
+            self._dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PredictionPointIndex:
+    """
+    A pixel-interleaved (row, col, band), memory-mapped copy of the prediction stack.
+
+    Every band's value for a pixel is stored contiguously, so a point lookup is a single
+    small read no matter how many bands there are. The file is a standard .npy, so the OS
+    page cache shares it between worker processes.
+
+    Args:
+        path: Path - The .npy file built by `build`.
+        raster: PredictionRaster - The raster the file was built from, for its band names and georeferencing.
+    """
+
+    def __init__(self, path: Path, raster: PredictionRaster):
+        self.path = Path(path)
+        self.values = np.load(self.path, mmap_mode="r")
+        self.band_names = raster.band_names
+        self.shape = raster.shape
+        self._inverse_transform = ~raster.transform
+        self._transformer = Transformer.from_crs("EPSG:4326", raster.crs, always_xy=True)
+
+    @classmethod
+    def build(cls, raster: PredictionRaster, path: Path, block_rows: int = 256) -> "PredictionPointIndex":
+        """
+        Write the interleaved copy of a raster to `path`, unless it already exists, and open it.
+
+        The raster is copied in blocks of rows so only one block is in memory at a time, and
+        the file is moved into place once complete so readers never see a partial file.
+        """
+        path = Path(path)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True, parents=True)
+            rows, cols = raster.shape
+            tmp_path = path.with_name(f".tmp-{os.getpid()}-{threading.get_ident()}-{path.name}")
+            values = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=raster.dtype, shape=(rows, cols, len(raster.band_names))
+            )
+            for row_off in range(0, rows, block_rows):
+                height = min(block_rows, rows - row_off)
+                block = raster.read(window=Window(0, row_off, cols, height))
+                values[row_off:row_off + height] = np.moveaxis(block, 0, -1)
+            values.flush()
+            del values
+            os.replace(tmp_path, path)
+        return cls(path, raster)
+
+    def query(self, lon: float, lat: float) -> dict[str, float] | None:
+        """
+        Get every band's prediction at a location.
+
+        Args:
+            lon: float - The longitude in EPSG:4326.
+            lat: float - The latitude in EPSG:4326.
+
+        Returns: dict[str, float] | None - The 0-1 prediction for each band, NaN where there is no data, or None outside the raster.
+        """
+        x, y = self._transformer.transform(lon, lat)
+        col, row = self._inverse_transform * (x, y)
+        row, col = math.floor(row), math.floor(col)
+        if not (0 <= row < self.shape[0] and 0 <= col < self.shape[1]):
+            return None
+        scores = scale_predictions(np.asarray(self.values[row, col]))
+        return dict(zip(self.band_names, scores.tolist()))
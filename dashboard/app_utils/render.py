@@ -0,0 +1,146 @@
+"Fast rendering of prediction bands to coloured images"
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# Quantised values use codes 0-254, the last code is reserved for missing data
+NODATA_CODE = 255
+N_LEVELS = 255
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(colormap="viridis") -> np.ndarray:
+    """
+    Build a 256 entry RGBA lookup table for a matplotlib colormap.
+
+    Entries 0-254 sample the colormap evenly from 0 to 1 and entry 255 is fully
+    transparent, for missing data.
+
+    Returns: np.ndarray - A read-only (256, 4) uint8 array.
+    """
+    # matplotlib is slow to import, so only load it once a colormap is needed
+    from matplotlib import colormaps
+
+    colormap_fn = colormaps[colormap]
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[:N_LEVELS] = np.rint(colormap_fn(np.linspace(0, 1, N_LEVELS)) * 255)
+    lut.flags.writeable = False
+    return lut
+
+
+def quantize(array: np.ndarray, vmin=None, vmax=None) -> np.ndarray:
+    """
+    Scale an array to uint8 codes between 0 and 254, with NaN mapped to 255.
+
+    Like `normalize`, the array's own min and max are used unless vmin and vmax are given.
+    """
+    array = np.asarray(array, dtype=np.float32)
+    missing = np.isnan(array)
+    if vmin is None or vmax is None:
+        if missing.all():
+            return np.full(array.shape, NODATA_CODE, dtype=np.uint8)
+        vmin, vmax = np.nanmin(array), np.nanmax(array)
+
+    scale = (N_LEVELS - 1) / (vmax - vmin) if vmax > vmin else 0
+    codes = (array - np.float32(vmin)) * np.float32(scale)
+    np.clip(codes, 0, N_LEVELS - 1, out=codes)
+    np.rint(codes, out=codes)
+    codes[missing] = NODATA_CODE
+    return codes.astype(np.uint8)
+
+
+def render_rgba(array: np.ndarray, colormap="viridis", vmin=None, vmax=None) -> np.ndarray:
+    """
+    Colour an array with a colormap lookup table.
+
+    Returns: np.ndarray - A (rows, cols, 4) uint8 RGBA array.
+    """
+    return colormap_lut(colormap)[quantize(array, vmin, vmax)]
+
+
+def encode_image(rgba: np.ndarray, image_format="png", compression=6) -> bytes:
+    """
+    Encode an RGBA array as a PNG or lossless WebP image.
+
+    Args:
+        rgba: np.ndarray - The (rows, cols, 4) uint8 array to encode.
+        image_format: str - Either "png" or "webp".
+        compression: int - The zlib level (0-9) for PNG, or the encoder effort (0-6) for WebP.
+
+    Returns: bytes - The encoded image.
+    """
+    image = Image.fromarray(rgba)
+    buffer = BytesIO()
+    if image_format == "png":
+        image.save(buffer, format="PNG", compress_level=compression)
+    elif image_format == "webp":
+        image.save(buffer, format="WEBP", lossless=True, method=compression)
+    else:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    return buffer.getvalue()
+
+
+def write_band_image(
+    band: np.ndarray,
+    out_path: Path,
+    colormap="viridis",
+    vmin=None,
+    vmax=None,
+    image_format="png",
+    compression=6,
+) -> Path:
+    """
+    Colour a band and write it to an image file.
+    """
+    rgba = render_rgba(band, colormap, vmin, vmax)
+    Path(out_path).write_bytes(encode_image(rgba, image_format, compression))
+    return out_path
+
+
+def write_band_images(
+    bands: dict[str, np.ndarray],
+    out_dir: Path,
+    colormap="viridis",
+    vmin=None,
+    vmax=None,
+    image_format="png",
+    compression=6,
+    max_workers: int | None = None,
+    band_ranges: dict[str, tuple[float, float]] | None = None,
+) -> dict[str, Path]:
+    """
+    Write a set of bands to image files in parallel worker processes.
+
+    Args:
+        bands: dict[str, np.ndarray] - The bands to render, keyed by the file name to give them.
+        out_dir: Path - The directory to write the images to.
+        max_workers: int | None - The number of processes to use, 1 renders in this process.
+        band_ranges: dict[str, tuple[float, float]] | None - Per-band (vmin, vmax), used instead of vmin and vmax.
+
+    Returns: dict[str, Path] - The path of each image, keyed by band name.
+    """
+    out_paths = {name: Path(out_dir) / f"{name}.{image_format}" for name in bands}
+    options = dict(colormap=colormap, image_format=image_format, compression=compression)
+    band_ranges = band_ranges or {}
+    jobs = [
+        (band, out_paths[name], *band_ranges.get(name, (vmin, vmax)))
+        for name, band in bands.items()
+    ]
+
+    if max_workers == 1 or len(bands) <= 1:
+        for band, out_path, band_vmin, band_vmax in jobs:
+            write_band_image(band, out_path, vmin=band_vmin, vmax=band_vmax, **options)
+        return out_paths
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(write_band_image, band, out_path, vmin=band_vmin, vmax=band_vmax, **options)
+            for band, out_path, band_vmin, band_vmax in jobs
+        ]
+        for future in futures:
+            future.result()
+    return out_paths
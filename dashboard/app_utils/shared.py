@@ -0,0 +1,219 @@
+"Memory-mapped Arrow copies of the app data, shared by every worker process on a host"
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from dotenv import load_dotenv
+
+from app_config import app_dir
+
+DEFAULT_SHARED_DIR = app_dir / "data" / "shared"
+# Snapshots older than this are reloaded from the bucket by the next process to start
+DEFAULT_MAX_AGE_SECONDS = 15 * 60
+
+# Set on the attrs of opened tables whose geometry is still WKB
+WKB_GEOMETRY_ATTR = "wkb_geometry"
+CRS_ATTR = "crs"
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Hold an exclusive lock on a file, shared by every process on the host that locks the same path.
+    """
+    with open(path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def as_geodataframe(df: pd.DataFrame) -> gpd.GeoDataFrame:
+    """
+    Build the geometry of a table opened by `SharedDataStore`, or return a GeoDataFrame unchanged.
+
+    Only the rows passed in are decoded, so a selection can be turned into shapely
+    geometry without decoding the whole table.
+    """
+    if isinstance(df, gpd.GeoDataFrame):
+        return df
+    geometry_column = df.attrs[WKB_GEOMETRY_ATTR]
+    geometry = shapely.from_wkb(df[geometry_column].to_numpy(dtype=object))
+    return gpd.GeoDataFrame(
+        df.drop(columns=geometry_column),
+        geometry=gpd.GeoSeries(geometry, index=df.index, crs=df.attrs[CRS_ATTR]),
+    )
+
+
+class SharedDataStore:
+    """
+    Snapshots of the app data tables as uncompressed Arrow IPC files on local disk.
+
+    One process loads the data and publishes a snapshot; the others memory-map its files,
+    so the table buffers live once in the OS page cache rather than once per worker.
+    Geometry is stored as WKB and only decoded by `as_geodataframe`. A new snapshot is
+    written to its own directory and made current with `os.replace`, and old snapshots
+    can be deleted while still mapped because the mapping outlives the file.
+
+    Args:
+        root: Path - The directory to keep the snapshots in.
+        max_age_seconds: float - How long a snapshot is reused for before it is reloaded.
+    """
+
+    def __init__(self, root: Path = DEFAULT_SHARED_DIR, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+        self.root.mkdir(exist_ok=True, parents=True)
+
+    @classmethod
+    def from_env(cls) -> "SharedDataStore":
+        """
+        Create a store configured by the SHARED_DATA_DIR and SHARED_DATA_MAX_AGE_SECONDS environment variables.
+        """
+        load_dotenv(app_dir / ".env")
+        root = Path(os.getenv("SHARED_DATA_DIR", DEFAULT_SHARED_DIR))
+        max_age_seconds = float(os.getenv("SHARED_DATA_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS))
+        return cls(root=root, max_age_seconds=max_age_seconds)
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold an exclusive lock shared by every process using the store.
+        """
+        with file_lock(self.root / ".lock"):
+            yield
+
+    def current(self) -> Path | None:
+        """
+        Get the directory of the current snapshot, or None if there isn't one.
+        """
+        try:
+            name = (self.root / "current").read_text().strip()
+        except FileNotFoundError:
+            return None
+        snapshot = self.root / name
+        return snapshot if (snapshot / "manifest.json").exists() else None
+
+    def is_fresh(self, snapshot: Path, version: str | None = None) -> bool:
+        """
+        Check whether a snapshot can be reused.
+
+        Args:
+            snapshot: Path - The snapshot directory.
+            version: str | None - The data version wanted. If given, the snapshot must be of this version, otherwise it must be younger than `max_age_seconds`.
+        """
+        manifest_path = snapshot / "manifest.json"
+        if version is not None:
+            return json.loads(manifest_path.read_text()).get("version") == version
+        return time.time() - manifest_path.stat().st_mtime < self.max_age_seconds
+
+    def publish(
+        self,
+        tables: dict[str, pd.DataFrame],
+        extras: dict[str, Any] | None = None,
+        version: str | None = None,
+    ) -> Path:
+        """
+        Write a snapshot of some tables and make it current.
+
+        Args:
+            tables: dict[str, pd.DataFrame] - The tables to share, GeoDataFrames have their geometry stored as WKB.
+            extras: dict[str, Any] | None - JSON serialisable values to share alongside the tables, e.g. the metadata.
+            version: str | None - The version of the data, checked by `is_fresh`.
+
+        Returns: Path - The snapshot directory.
+        """
+        snapshot = Path(tempfile.mkdtemp(dir=self.root, prefix=f"snapshot-{time.time_ns()}-"))
+        manifest = {"version": version, "tables": {}, "extras": extras or {}}
+        for name, df in tables.items():
+            geometry = None
+            if isinstance(df, gpd.GeoDataFrame):
+                geometry = {"column": df.geometry.name, "crs": df.crs.to_string() if df.crs else None}
+                wkb = df.geometry.to_wkb()
+                df = pd.DataFrame(df.drop(columns=df.geometry.name)).assign(**{df.geometry.name: wkb})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # Uncompressed, so the buffers can be used straight from the mapped file
+            with pa.OSFile(str(snapshot / f"{name}.arrow"), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            manifest["tables"][name] = {"geometry": geometry}
+        (snapshot / "manifest.json").write_text(json.dumps(manifest))
+
+        tmp_pointer = self.root / f".current-{os.getpid()}"
+        tmp_pointer.write_text(snapshot.name)
+        os.replace(tmp_pointer, self.root / "current")
+        self.prune(keep=snapshot)
+        return snapshot
+
+    def prune(self, keep: Path):
+        """
+        Delete every snapshot except `keep`. Processes that have mapped them keep their copy.
+        """
+        for snapshot in self.root.glob("snapshot-*"):
+            if snapshot != keep:
+                shutil.rmtree(snapshot, ignore_errors=True)
+
+    def open(self, snapshot: Path) -> tuple[dict[str, pd.DataFrame], dict[str, Any]]:
+        """
+        Memory-map the tables of a snapshot.
+
+        Numeric and string columns reference the mapped buffers rather than copying them.
+        Strings are only shared because pandas 3 backs them with Arrow, as the requirements
+        pin; pandas 2 would copy them into object arrays in every worker.
+        Tables that had geometry keep it as a WKB column, see `as_geodataframe`.
+
+        Returns: tuple[dict[str, pd.DataFrame], dict[str, Any]] - The tables and the extras.
+        """
+        manifest = json.loads((snapshot / "manifest.json").read_text())
+        tables = {}
+        for name, info in manifest["tables"].items():
+            with pa.memory_map(str(snapshot / f"{name}.arrow"), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = table.to_pandas(
+                split_blocks=True,
+                types_mapper={pa.binary(): pd.ArrowDtype(pa.binary())}.get,
+            )
+            if info["geometry"] is not None:
+                df.attrs[WKB_GEOMETRY_ATTR] = info["geometry"]["column"]
+                df.attrs[CRS_ATTR] = info["geometry"]["crs"]
+            tables[name] = df
+        return tables, manifest["extras"]
+
+    def load(
+        self,
+        loader: Callable[[], tuple[dict[str, pd.DataFrame], dict[str, Any]]],
+        version: str | None = None,
+    ) -> tuple[dict[str, pd.DataFrame], dict[str, Any], bool]:
+        """
+        Open the current snapshot, or load and publish a new one if it is missing or stale.
+
+        The lock is held while loading, so when several workers start together only the
+        first one loads from the bucket and the rest wait for it and map its snapshot. It is
+        held until the snapshot is mapped too, so another worker can't prune it first.
+
+        Args:
+            loader: Callable - Returns the tables and extras to publish.
+            version: str | None - The data version wanted, see `is_fresh`.
+
+        Returns: tuple - The tables, the extras and whether this process published them.
+        """
+        with self.lock():
+            snapshot = self.current()
+            published = snapshot is None or not self.is_fresh(snapshot, version)
+            if published:
+                tables, extras = loader()
+                snapshot = self.publish(tables, extras, version)
+            tables, extras = self.open(snapshot)
+        return tables, extras, published
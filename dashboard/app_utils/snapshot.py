@@ -0,0 +1,193 @@
+"Versioned snapshots of the app data, reloaded in the background when new data is published"
+import logging
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable
+
+import geopandas as gpd
+import pandas as pd
+
+from app_config import record_cluster_max_zoom, record_cluster_threshold, record_style, species_name_mapping
+from app_utils.data import (
+    build_records_index,
+    calculate_dependence_range,
+    cluster_records,
+    compact_records,
+    records_to_geojson,
+    simplify_boundary,
+)
+from app_utils.map import BasemapTemplate
+from app_utils.plots import PartialDependenceCurves, PartialDependencePlots
+from app_utils.shared import as_geodataframe
+
+logger = logging.getLogger(__name__)
+
+
+class AppDataSnapshot:
+    """
+    One version of the app data, with the indexes and caches derived from it.
+
+    A snapshot is never modified once built, so sessions can keep reading one while the
+    next is built. Its caches belong to it, so they are released along with it.
+
+    Args:
+        data: dict[str, Any] - The app data, as returned by `load_app_data`.
+        version: str - The version of the published data the snapshot was loaded from.
+        plot_cache_dir: Path - The directory to keep the rendered partial dependence plots in.
+        load_timings: dict[str, float] | None - The seconds each asset took to load.
+    """
+
+    def __init__(
+        self,
+        data: dict[str, Any],
+        version: str,
+        plot_cache_dir: Path,
+        load_timings: dict[str, float] | None = None,
+    ):
+        self.version = version
+        self.load_timings = load_timings or {}
+        self.results_df: pd.DataFrame = data["results_df"]
+        # The asset keeps its old name so bundles published before the records were compacted still load
+        self.training_records_df = compact_records(data["training_data_gdf"])
+        self.partial_dependence_df: pd.DataFrame = data["partial_dependence_df"]
+        self.south_yorkshire: gpd.GeoDataFrame = as_geodataframe(data["south_yorkshire"])
+        self.metadata: dict = data["metadata"]
+        # Every session's map is built from this, rather than from the boundary itself
+        self.basemap_template = BasemapTemplate(
+            simplify_boundary(self.south_yorkshire), self.south_yorkshire.total_bounds
+        )
+
+        self.dependence_range = calculate_dependence_range(self.partial_dependence_df)
+        self.partial_dependence_plots = PartialDependencePlots(
+            PartialDependenceCurves(self.partial_dependence_df), cache_dir=plot_cache_dir
+        )
+        self.training_records_index = build_records_index(self.training_records_df)
+        # Returned for selections with no records
+        self.no_training_records = self.training_records_df.iloc[:0]
+
+        self.tif_bounds = self.metadata["prediction_bbox"]
+        self.tif_crs = self.metadata["bbox_crs"]
+        # Labels for the scores shown when the map is clicked
+        self.band_labels = {
+            row.band_name: f"{species_name_mapping.get(row.latin_name, row.latin_name)} ({row.activity_type})"
+            for row in self.results_df.itertuples()
+        }
+        # Levels of downsampled overlays, if they were published with this model run
+        self.prediction_pyramid = self.metadata.get("prediction_pyramid")
+        self.prediction_image_format = (self.prediction_pyramid or {}).get("image_format", "png")
+
+        # Map payloads shared by every session reading this snapshot
+        self.records_geojson = lru_cache(maxsize=64)(self._records_geojson)
+        self.clustered_records_geojson = lru_cache(maxsize=256)(self._clustered_records_geojson)
+
+    def training_records(self, latin_name: str, activity_type: str) -> pd.DataFrame:
+        """
+        Get the records for a selection, the "All" activity type holds every record for the species.
+        """
+        return self.training_records_index.get((latin_name, activity_type), self.no_training_records)
+
+    def _records_geojson(self, latin_name: str, activity_type: str) -> dict:
+        records = self.training_records(latin_name, activity_type)
+        # Styled here rather than by the layer, which would deep copy the payload for every session
+        return records_to_geojson(records, style=record_style)
+
+    def _clustered_records_geojson(self, latin_name: str, activity_type: str, zoom: int) -> dict:
+        # Selections with more than `record_cluster_threshold` records are sent as clusters
+        # until the map is zoomed in to `record_cluster_max_zoom`
+        records = self.training_records(latin_name, activity_type)
+        if len(records) <= record_cluster_threshold or zoom >= record_cluster_max_zoom:
+            return self.records_geojson(latin_name, activity_type)
+        return cluster_records(records, zoom, style=record_style)
+
+
+class SnapshotReloader:
+    """
+    Hold the current app data snapshot and replace it when new data is published.
+
+    A background thread checks the published version every `interval_seconds`. When it
+    changes, the new data is loaded and indexed on that thread and then swapped in with a
+    single assignment, so requests keep being served from the old snapshot until the new
+    one is complete. Nothing else keeps a reference to a replaced snapshot, so it is freed
+    once the sessions reading it have moved on.
+
+    Args:
+        load: Callable - Loads and builds the snapshot for a version.
+        version: Callable - Returns the version of the published data. Should be cheap, e.g. blob metadata only.
+        interval_seconds: float - How often to check for new data.
+        on_swap: list[Callable] | None - Called with the old and new snapshot after each swap, e.g. to clear caches of the old data.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], AppDataSnapshot],
+        version: Callable[[], str],
+        interval_seconds: float = 300,
+        on_swap: list[Callable[[AppDataSnapshot, AppDataSnapshot], None]] | None = None,
+    ):
+        self.load = load
+        self.version = version
+        self.interval_seconds = interval_seconds
+        self.on_swap = on_swap or []
+        self.current: AppDataSnapshot | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Only one check runs at a time, e.g. a manual reload during a scheduled one
+        self._reload_lock = threading.Lock()
+
+    def load_initial(self) -> AppDataSnapshot:
+        """
+        Load the first snapshot, on the calling thread.
+        """
+        self.current = self.load(self.version())
+        return self.current
+
+    def check(self) -> bool:
+        """
+        Load and swap in a new snapshot if the published version has changed.
+
+        Returns: bool - Whether a new snapshot was swapped in.
+        """
+        with self._reload_lock:
+            version = self.version()
+            if self.current is not None and version == self.current.version:
+                return False
+
+            start = time.perf_counter()
+            new = self.load(version)
+            old, self.current = self.current, new
+            logger.info("Swapped in app data version %s in %.2fs", version, time.perf_counter() - start)
+
+        for hook in self.on_swap:
+            try:
+                hook(old, new)
+            except Exception:
+                logger.exception("App data swap hook %r failed", hook)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.check()
+            except Exception:
+                # Keep serving the current snapshot and try again next time
+                logger.exception("Failed to reload app data")
+
+    def start(self):
+        """
+        Start checking for new data in a background thread.
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="app_data_reloader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,213 @@
+"XYZ tile server for the habitat suitability predictions"
+import math
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app_utils.render import encode_image, render_rgba
+
+TILE_SIZE = 256
+# Half the width of the web mercator world in metres
+MERCATOR_ORIGIN = 20037508.342789244
+NODATA = -1
+# The longest side of the overview band ranges are approximated from, for COGs without band statistics
+RANGE_OVERVIEW_SIZE = 1024
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """
+    Get the web mercator bounds of an XYZ tile.
+
+    Returns: tuple - The bounds in the format (minx, miny, maxx, maxy).
+    """
+    tile_width = 2 * MERCATOR_ORIGIN / 2**z
+    minx = -MERCATOR_ORIGIN + x * tile_width
+    maxy = MERCATOR_ORIGIN - y * tile_width
+    return (minx, maxy - tile_width, minx + tile_width, maxy)
+
+
+class TileRenderer:
+    """
+    Render map tiles from windows of the predictions COG, with an LRU cache of encoded tiles.
+
+    Tiles are coloured with the same colormap and per-band scaling as `write_tif_to_pngs`,
+    so they match the whole-extent PNG overlays, see `_band_range`. The cache is shared by every session in
+    the process.
+
+    Args:
+        source: Callable - Returns the local path of the predictions COG. Called on the first tile request.
+        colormap: str - The matplotlib colormap to colour the tiles with.
+        max_tiles: int - The maximum number of encoded tiles to keep in memory.
+    """
+
+    def __init__(self, source: Callable[[], Path], colormap="viridis", max_tiles: int = 4096):
+        self.source = source
+        self.colormap = colormap
+        self.max_tiles = max_tiles
+        self._dataset = None
+        # Incremented by `clear`, so tiles of a replaced COG are never cached
+        self._generation = 0
+        self._bands: dict[str, int] = {}
+        self._band_ranges: dict[str, tuple[float, float]] = {}
+        self._mercator_bounds = None
+        self._tiles: OrderedDict[tuple, bytes] = OrderedDict()
+        # rasterio datasets aren't thread safe
+        self._read_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._empty_tile = encode_image(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+    def _open(self):
+        if self._dataset is None:
+            # rasterio is imported with the first tile so it doesn't slow down startup
+            import rasterio
+            from rasterio.warp import transform_bounds
+
+            dataset = rasterio.open(self.source())
+            self._bands = {name: index for index, name in enumerate(dataset.descriptions, start=1)}
+            self._mercator_bounds = transform_bounds(dataset.crs, "EPSG:3857", *dataset.bounds)
+            self._dataset = dataset
+        return self._dataset
+
+    def band_names(self) -> list[str]:
+        """
+        Get the names of the bands tiles can be rendered for.
+        """
+        with self._read_lock:
+            self._open()
+            return list(self._bands)
+
+    def _band_range(self, band_name: str) -> tuple[float, float]:
+        """
+        Get the min and max a band is scaled by, from the dataset tiles are read from.
+
+        Call with `_read_lock` held. COGs published with STATISTICS_MINIMUM and
+        STATISTICS_MAXIMUM band tags, see `write_band_statistics`, are scaled exactly like
+        `write_tif_to_pngs` does. Otherwise the range is approximated from an overview of
+        at most `RANGE_OVERVIEW_SIZE` pixels, so the full band is never read while the lock
+        is held, and the colours can differ slightly from the PNG overlays.
+        """
+        if band_name not in self._band_ranges:
+            from rasterio.enums import Resampling
+
+            dataset, index = self._dataset, self._bands[band_name]
+            tags = dataset.tags(index)
+            if "STATISTICS_MINIMUM" in tags and "STATISTICS_MAXIMUM" in tags and float(tags["STATISTICS_MINIMUM"]) >= 0:
+                band_range = (float(tags["STATISTICS_MINIMUM"]) / 100, float(tags["STATISTICS_MAXIMUM"]) / 100)
+            else:
+                factor = max(1, math.ceil(max(dataset.height, dataset.width) / RANGE_OVERVIEW_SIZE))
+                out_shape = (math.ceil(dataset.height / factor), math.ceil(dataset.width / factor))
+                band = dataset.read(index, out_shape=out_shape, resampling=Resampling.nearest)
+                band = band[band >= 0] / 100
+                band_range = (float(band.min()), float(band.max()))
+            self._band_ranges[band_name] = band_range
+        return self._band_ranges[band_name]
+
+    def _intersects(self, bounds) -> bool:
+        minx, miny, maxx, maxy = self._mercator_bounds
+        return not (bounds[0] >= maxx or bounds[2] <= minx or bounds[1] >= maxy or bounds[3] <= miny)
+
+    def _render(self, band_name: str, z: int, x: int, y: int) -> tuple[bytes, int]:
+        """
+        Render a tile, returning it with the generation of the COG it was read from.
+
+        The dataset, its band range and the tile window are all read under one hold of
+        `_read_lock`, so `clear` can't close the dataset part way through.
+        """
+        from rasterio.enums import Resampling
+        from rasterio.transform import from_bounds
+        from rasterio.vrt import WarpedVRT
+
+        with self._read_lock:
+            dataset = self._open()
+            generation = self._generation
+            if band_name not in self._bands:
+                raise KeyError(band_name)
+
+            bounds = tile_bounds(z, x, y)
+            if not self._intersects(bounds):
+                return self._empty_tile, generation
+
+            vmin, vmax = self._band_range(band_name)
+            with WarpedVRT(
+                dataset,
+                crs="EPSG:3857",
+                transform=from_bounds(*bounds, TILE_SIZE, TILE_SIZE),
+                width=TILE_SIZE,
+                height=TILE_SIZE,
+                src_nodata=NODATA if dataset.nodata is None else dataset.nodata,
+                nodata=NODATA,
+                resampling=Resampling.nearest,
+            ) as vrt:
+                window = vrt.read(self._bands[band_name])
+
+        window = np.where(window >= 0, window / 100, np.nan)
+        if np.isnan(window).all():
+            return self._empty_tile, generation
+        return encode_image(render_rgba(window, colormap=self.colormap, vmin=vmin, vmax=vmax)), generation
+
+    def tile(self, band_name: str, z: int, x: int, y: int) -> bytes:
+        """
+        Get a tile as PNG bytes, rendering it if it isn't cached.
+
+        Cached tiles are keyed by the generation of the COG, which `clear` increments, and a
+        tile rendered from a COG that has since been cleared is returned but not cached.
+
+        Raises: KeyError - If there is no band with the given name.
+        """
+        with self._cache_lock:
+            key = (self._generation, band_name, z, x, y)
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+
+        png, generation = self._render(band_name, z, x, y)
+
+        with self._cache_lock:
+            if generation == self._generation:
+                self._tiles[(generation, band_name, z, x, y)] = png
+                while len(self._tiles) > self.max_tiles:
+                    self._tiles.popitem(last=False)
+        return png
+
+    def clear(self):
+        """
+        Close the COG and forget all cached tiles, e.g. after new predictions have been published.
+        """
+        with self._read_lock, self._cache_lock:
+            if self._dataset is not None:
+                self._dataset.close()
+            self._dataset = None
+            self._generation += 1
+            self._band_ranges.clear()
+            self._tiles.clear()
+
+
+def tile_app(renderer: TileRenderer) -> Starlette:
+    """
+    Create an ASGI app serving `/{band_name}/{z}/{x}/{y}.png` tiles from a renderer.
+
+    Tiles may be cached by browsers for an hour, so tile URLs should carry the data version
+    in their query string, e.g. `?v=...`, to be refetched when the predictions change.
+    """
+
+    async def tile(request: Request) -> Response:
+        params = request.path_params
+        if not 0 <= params["z"] <= 24 or not 0 <= params["x"] < 2 ** params["z"] or not 0 <= params["y"] < 2 ** params["z"]:
+            return Response(status_code=404)
+        try:
+            png = await run_in_threadpool(
+                renderer.tile, params["band_name"], params["z"], params["x"], params["y"]
+            )
+        except KeyError:
+            return Response(status_code=404)
+        return Response(png, media_type="image/png", headers={"Cache-Control": "public, max-age=3600"})
+
+    return Starlette(routes=[Route("/{band_name}/{z:int}/{x:int}/{y:int}.png", tile)])
@@ -0,0 +1,103 @@
+"Zonal statistics of the prediction stack for user-drawn areas"
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio.features import geometry_mask
+from rasterio.windows import transform as window_transform
+
+from app_utils.geo import project_geometry
+from app_utils.raster import PREDICTION_SCALE, PredictionRaster
+
+# Square metres in a hectare
+M2_PER_HA = 10_000
+
+
+class ZonalStats:
+    """
+    Summarise every band of the predictions within a polygon.
+
+    The polygon is rasterised once into a mask over the window it covers, and all the bands
+    in that window are reduced together. Results are cached by a hash of the geometry, so
+    redrawing or re-selecting the same area is free.
+
+    Args:
+        raster: PredictionRaster - The predictions to summarise.
+        max_cache: int - The maximum number of areas to keep results for.
+    """
+
+    def __init__(self, raster: PredictionRaster, max_cache: int = 128):
+        self.raster = raster
+        self.max_cache = max_cache
+        self._cache: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def geometry_key(geometry, threshold: float) -> str:
+        """
+        Hash a geometry and threshold into a cache key.
+        """
+        wkb = shapely.to_wkb(shapely.normalize(geometry))
+        return hashlib.sha1(wkb + str(threshold).encode("utf-8")).hexdigest()
+
+    def compute(self, geometry, threshold: float = 0.5, crs="EPSG:4326") -> pd.DataFrame:
+        """
+        Calculate the mean, max and area above a threshold of every band within a polygon.
+
+        Args:
+            geometry: shapely.Geometry - The polygon to summarise.
+            threshold: float - The 0-1 suitability score to count the area above.
+            crs: str - The CRS of the geometry.
+
+        Returns: pd.DataFrame - One row per band with columns band_name, mean, max and area_above_threshold_ha. The mean and max are NaN for bands with no data in the polygon.
+        """
+        key = self.geometry_key(geometry, threshold) + str(crs)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        stats = self._compute(project_geometry(geometry, crs, self.raster.crs), threshold)
+
+        with self._lock:
+            self._cache[key] = stats
+            while len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+        return stats
+
+    def _compute(self, geometry, threshold: float) -> pd.DataFrame:
+        n_bands = len(self.raster.band_names)
+        window = self.raster.window(geometry.bounds)
+        if window.width < 1 or window.height < 1:
+            values = np.empty((n_bands, 0), dtype=self.raster.dtype)
+        else:
+            mask = geometry_mask(
+                [geometry],
+                out_shape=(int(window.height), int(window.width)),
+                transform=window_transform(window, self.raster.transform),
+                invert=True,
+            )
+            # (bands, pixels) of the stored values inside the polygon
+            values = self.raster.read(window=window)[:, mask]
+
+        valid = values >= 0
+        counts = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, values, 0).sum(axis=1) / counts / PREDICTION_SCALE
+        max_value = np.where(valid, values, -1).max(axis=1, initial=-1).astype(np.float64)
+        max_value = np.where(counts > 0, max_value / PREDICTION_SCALE, np.nan)
+
+        pixel_area = abs(self.raster.transform.a * self.raster.transform.e)
+        above = (values >= threshold * PREDICTION_SCALE).sum(axis=1)
+
+        return pd.DataFrame(
+            {
+                "band_name": self.raster.band_names,
+                "mean": mean,
+                "max": max_value,
+                "area_above_threshold_ha": above * pixel_area / M2_PER_HA,
+            }
+        )
@@ -44,6 +44,11 @@ def app_ui(css_path, species_name_mapping, results_df):
                         ui.output_ui("model_description"),
                         class_="model-description-container",
                     ),
+                    ui.div(
+                        ui.tags.p("Draw an area on the map to summarise every model within it."),
+                        ui.output_data_frame("zonal_stats_table"),
+                        class_="zonal-stats-container",
+                    ),
                     class_="model-selection-container",
                 ),
             ),
@@ -85,7 +90,7 @@ def app_ui(css_path, species_name_mapping, results_df):
                             ),
                             ui.row(
                                 ui.div(
-                                    ui.output_plot("partial_dependence_plot"),
+                                    ui.output_image("partial_dependence_plot", height="auto"),
                                     class_="partial-dependence-plot-container",
                                 ),
                                 ui.tags.p(partial_dependence_explanation),
@@ -0,0 +1,32 @@
+"""
+Pack the app data blobs into a single bundle and optionally upload it to the bucket.
+
+Run after publishing new model outputs, from the repository root with the app's
+environment variables set:
+
+    python scripts/build_app_data_bundle.py app-data-bundle.zip --upload
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "dashboard"))
+
+from app_utils.data import build_app_data_bundle, bundle_blob_name  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("out_path", type=Path, help="The local file to write the bundle to.")
+    parser.add_argument("--upload", action="store_true", help=f"Upload the bundle to {bundle_blob_name}.")
+    args = parser.parse_args()
+
+    manifest = build_app_data_bundle(args.out_path, upload=args.upload)
+    size_mb = args.out_path.stat().st_size / 1024**2
+    print(f"Wrote bundle {manifest['version']} ({size_mb:.1f}MB) to {args.out_path}")
+    print(json.dumps(manifest["tables"], indent=4))
+
+
+if __name__ == "__main__":
+    main()